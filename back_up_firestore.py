@@ -1,7 +1,52 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import gzip
+import hashlib
 import json
-from datetime import datetime
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import firestore_ops
+
+BACKUP_FORMATS = ("jsonl", "json", "jsonl.gz")
+DEFAULT_WORKERS = 6
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+INDEX_SUFFIX = ".idx"
+MERKLE_SUFFIX = ".merkle"
+# Hash trees have 16 children per node; shards are hashed into 16**3 leaf buckets and
+# folded to about MERKLE_LEAF_TARGET documents per leaf when saved
+MERKLE_FANOUT_BITS = 4
+MAX_MERKLE_DEPTH = 3
+MERKLE_LEAF_TARGET = 64
+DEFAULT_MANIFEST = "backup_manifest.json"
+
+# Field that moves forward whenever a document changes, per collection. Incremental
+# backups only read documents past the last high-water mark of that field; collections
+# without one are exported in full by every delta. Deletions are not visible to a
+# delta and only disappear at the next full backup.
+CHANGE_FIELDS = {
+    "episodes": "updatedAt",
+    "factChecks": "updatedAt",
+    "comments": "updatedAt",
+    "karmaHistory": "timestamp",
+    "userKarma": "lastUpdated",
+    "votes": "timestamp",
+    "transcriptChunks": "updatedAt",
+}
+
+# Known subcollections, keyed by the name used in collection-group queries.
+# Each one is exported as a "<parent>.<name>" shard next to its parent collection.
+SUBCOLLECTIONS = {
+    "votes": ["factChecks", "comments"],
+    "transcriptChunks": ["episodes"],
+}
+# Collections rebuilt from the others by materialize_episodes.py and build_search_index.py.
+# They hold a full copy of every transcript and have no change field, so backups skip
+# them unless asked for by name; re-run the builders after a restore instead.
+DERIVED_COLLECTIONS = frozenset(["episodePayloads", "searchIndex"])
+# Documents per collection whose subcollections are listed, to find any missing above
+SUBCOLLECTION_SAMPLE = 20
 
 def convert_timestamp(obj):
     """Convert Firestore timestamps to string format."""
@@ -9,40 +54,726 @@ def convert_timestamp(obj):
         return obj.isoformat()
     raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
 
-def backup_firestore():
-    """Creates a backup of all documents in the episodes collection."""
-    # Initialize Firebase if not already initialized
+def document_hash(data):
+    """Hash a document's data in canonical form.
+
+    Live snapshots and backup records hash alike, since timestamps are hashed as the
+    ISO strings the backup stores them as.
+    """
+    canonical = json.dumps(data, default=convert_timestamp, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+def timestamp_paths(value, path=()):
+    """List the key paths of the timestamps in a document, e.g. [["createdAt"], ["history", 0, "at"]]."""
+    if isinstance(value, datetime):
+        return [list(path)]
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return []
+    return [found for key, item in items for found in timestamp_paths(item, path + (key,))]
+
+def serialize_document(doc):
+    """Convert a document snapshot into a backup record.
+
+    Timestamps are stored as ISO strings, so their key paths are recorded for the
+    restore to turn back into timestamps.
+    """
+    data = doc.to_dict()
+    return {
+        'id': doc.id,
+        'path': doc.reference.path,
+        'data': data,
+        'hash': document_hash(data),
+        'timestamps': timestamp_paths(data)
+    }
+
+def record_hash(record):
+    """Return a record's content hash, computing it for backups written before hashes were stored."""
+    return record.get('hash') or document_hash(record['data'])
+
+def merkle_bucket(path, depth):
+    """Return the leaf bucket of a document path in a hash tree of the given depth."""
+    key = int.from_bytes(hashlib.blake2b(path.encode("utf-8"), digest_size=8).digest(), "big")
+    return key >> (64 - MERKLE_FANOUT_BITS * depth)
+
+def dump_record(record):
+    """Serialize a single backup record to a compact JSON string."""
+    return json.dumps(record, default=convert_timestamp, ensure_ascii=False)
+
+class MerkleTree:
+    """Order-independent hash tree over the documents of one shard.
+
+    Documents fall into leaf buckets by a hash of their path, and every node is the
+    XOR of the (path, content hash) digests below it. Backups stream documents in any
+    order and need no sorting, and two trees can be compared level by level, only
+    descending into the subtrees whose hashes differ.
+
+    A tree built with location_width also keeps, per leaf, where each document's
+    record sits in the shard file, so a differing leaf can be read back on its own.
+    """
+
+    def __init__(self, depth=MAX_MERKLE_DEPTH, location_width=0):
+        self.depth = depth
+        self.leaves = [0] * (1 << (MERKLE_FANOUT_BITS * depth))
+        self.counts = [0] * len(self.leaves)
+        self.count = 0
+        self.location_width = location_width
+        self.locations = [array('q') for _ in self.leaves] if location_width else None
+
+    def add(self, path, content_hash, location=()):
+        bucket = merkle_bucket(path, self.depth)
+        digest = hashlib.blake2b(f"{path}\0{content_hash}".encode("utf-8"), digest_size=16).digest()
+        self.leaves[bucket] ^= int.from_bytes(digest, "big")
+        self.counts[bucket] += 1
+        self.count += 1
+        if self.locations is not None:
+            self.locations[bucket].extend(location)
+
+    def add_record(self, record, location=()):
+        self.add(record['path'], record_hash(record), location)
+
+    def folded(self, depth):
+        """Return this tree with fewer levels, each leaf combining 16**(self.depth - depth) leaves."""
+        if depth >= self.depth:
+            return self
+        tree = MerkleTree(depth, self.location_width)
+        shift = MERKLE_FANOUT_BITS * (self.depth - depth)
+        for bucket, (leaf, count) in enumerate(zip(self.leaves, self.counts)):
+            tree.leaves[bucket >> shift] ^= leaf
+            tree.counts[bucket >> shift] += count
+            if self.locations is not None:
+                tree.locations[bucket >> shift].extend(self.locations[bucket])
+        tree.count = self.count
+        return tree
+
+    def located(self, depth, buckets):
+        """Yield the stored locations of the documents in the given buckets of a level at most self.depth deep."""
+        shift = MERKLE_FANOUT_BITS * (self.depth - depth)
+        width = self.location_width
+        for bucket in buckets:
+            for leaf in range(bucket << shift, (bucket + 1) << shift):
+                values = self.locations[leaf]
+                for i in range(0, len(values), width):
+                    yield tuple(values[i:i + width])
+
+    def level(self, depth):
+        """Return the node hashes of one level, the root being level 0."""
+        return self.folded(depth).leaves
+
+    def compact(self):
+        """Fold to the smallest depth that keeps about MERKLE_LEAF_TARGET documents per leaf."""
+        depth = 0
+        while depth < self.depth and (1 << (MERKLE_FANOUT_BITS * depth)) * MERKLE_LEAF_TARGET < self.count:
+            depth += 1
+        return self.folded(depth)
+
+    def to_dict(self):
+        data = {
+            "depth": self.depth,
+            "count": self.count,
+            "leaves": [format(leaf, "032x") for leaf in self.leaves],
+            "counts": self.counts
+        }
+        if self.locations is not None:
+            data["locationWidth"] = self.location_width
+            data["locations"] = [values.tolist() for values in self.locations]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        # Trees saved before locations were stored load without them
+        tree = cls(data["depth"], data.get("locationWidth", 0))
+        tree.leaves = [int(leaf, 16) for leaf in data["leaves"]]
+        tree.counts = data["counts"]
+        tree.count = data["count"]
+        if tree.locations is not None:
+            tree.locations = [array('q', values) for values in data["locations"]]
+        return tree
+
+    def save(self, filename):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.compact().to_dict(), f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+def mismatched_buckets(a, b):
+    """Return the leaf buckets, at the shallower of the two depths, where the trees differ.
+
+    The comparison starts at the roots and only expands the children of differing
+    nodes, so matching trees cost one comparison and the work grows with the differences.
+    """
+    depth = min(a.depth, b.depth)
+    a, b = a.folded(depth), b.folded(depth)
+    candidates = [0]
+    for level in range(depth + 1):
+        left, right = a.level(level), b.level(level)
+        mismatched = [node for node in candidates if left[node] != right[node]]
+        if level == depth:
+            return depth, mismatched
+        candidates = [(node << MERKLE_FANOUT_BITS) + child for node in mismatched
+                      for child in range(1 << MERKLE_FANOUT_BITS)]
+
+class JsonLinesWriter:
+    """Writes one record per line so every completed line is a valid document.
+
+    The hash tree stores each record's [start, end) byte range in the file.
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, "wb")
+        self.filename = filename
+        self.tree = MerkleTree(location_width=2)
+        self.count = 0
+        self.offset = 0
+
+    def write(self, record):
+        data = dump_record(record).encode("utf-8")
+        self.f.write(data + b"\n")
+        self.f.flush()
+        self.tree.add_record(record, (self.offset, self.offset + len(data)))
+        self.offset += len(data) + 1
+        self.count += 1
+
+    def close(self):
+        self.f.close()
+        self.tree.save(f"{self.filename}{MERKLE_SUFFIX}")
+
+class JsonArrayWriter:
+    """Writes a JSON array incrementally, one record per line.
+
+    The hash tree stores each record's [start, end) byte range in the file.
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, "wb")
+        self.filename = filename
+        self.tree = MerkleTree(location_width=2)
+        self.count = 0
+        self.f.write(b"[")
+        self.offset = 1
+
+    def write(self, record):
+        separator = b",\n" if self.count else b"\n"
+        data = dump_record(record).encode("utf-8")
+        self.f.write(separator + data)
+        self.f.flush()
+        start = self.offset + len(separator)
+        self.tree.add_record(record, (start, start + len(data)))
+        self.offset = start + len(data)
+        self.count += 1
+
+    def close(self):
+        # Always close the array, so an interrupted run still leaves valid JSON
+        self.f.write(b"\n]\n")
+        self.f.close()
+        self.tree.save(f"{self.filename}{MERKLE_SUFFIX}")
+
+class ChunkedArchiveWriter:
+    """Writes JSON Lines as a sequence of independently gzipped chunks plus a side index.
+
+    The archive is an ordinary multi-member gzip file (gzip -dc yields the JSONL), and
+    the index maps each document path to its chunk and byte range inside that chunk,
+    so one document can be read back by decompressing a single chunk. The index gets
+    a line per chunk as soon as the chunk is written, so an interrupted run still
+    leaves every completed chunk indexed.
+    """
+
+    def __init__(self, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.f = open(filename, "wb")
+        self.index = open(f"{filename}{INDEX_SUFFIX}", "w", encoding="utf-8")
+        self.tree_filename = f"{filename}{MERKLE_SUFFIX}"
+        # Tree locations are [chunk, start, end], as in the index
+        self.tree = MerkleTree(location_width=3)
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.buffer = bytearray()
+        self.chunk_count = 0
+        # Byte ranges of the documents in the chunk being filled
+        self.documents = {}
+        self.index.write(json.dumps({"chunkSize": chunk_size}) + "\n")
+
+    def write(self, record):
+        line = (dump_record(record) + "\n").encode("utf-8")
+        self.documents[record['path']] = [len(self.buffer), len(self.buffer) + len(line)]
+        self.tree.add_record(record, (self.chunk_count, len(self.buffer), len(self.buffer) + len(line)))
+        self.buffer += line
+        self.count += 1
+        if len(self.buffer) >= self.chunk_size:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        if not self.buffer:
+            return
+        compressed = gzip.compress(bytes(self.buffer), mtime=0)
+        offset = self.f.tell()
+        self.f.write(compressed)
+        self.f.flush()
+        # Indexed only once the chunk is on disk
+        self.index.write(json.dumps({"chunk": [offset, len(compressed)], "documents": self.documents},
+                                    ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.index.flush()
+        self.chunk_count += 1
+        self.buffer.clear()
+        self.documents = {}
+
+    def close(self):
+        self.flush_chunk()
+        self.f.close()
+        self.index.close()
+        self.tree.save(self.tree_filename)
+
+WRITERS = {
+    "jsonl": JsonLinesWriter,
+    "json": JsonArrayWriter,
+    "jsonl.gz": ChunkedArchiveWriter,
+}
+
+def iter_json_array(f, read_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(read_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expected a JSON array")
+    pos = 1
+    while True:
+        # Skip whitespace and separators, refilling the buffer as needed
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer):
+                break
+            buffer, pos = f.read(read_size), 0
+            if not buffer:
+                return
+        if buffer[pos] == "]":
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element continues past the buffer; grow it geometrically so
+            # large documents are not re-parsed once per read
+            chunk = f.read(max(read_size, len(buffer)))
+            if not chunk:
+                # Only a file cut off before its closing bracket has a truncated last
+                # record; anything else is malformed and must not pass as a short file
+                if buffer[pos:].rstrip().endswith("]"):
+                    raise
+                print(f"Skipping truncated record in {getattr(f, 'name', 'input')}")
+                return
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield item
+
+def iter_shard_records(filename):
+    """Yield the records of a shard written by any of the WRITERS."""
+    if filename.endswith(".json"):
+        with open(filename, "r", encoding="utf-8") as f:
+            yield from iter_json_array(f)
+        return
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write can leave one truncated final line
+                    print(f"Skipping truncated record in {filename}")
+        except (EOFError, gzip.BadGzipFile):
+            # ... or, in a chunked archive, one truncated final chunk
+            print(f"Skipping truncated chunk in {filename}")
+
+def load_archive_index(filename):
+    """Load the side index of a chunked archive shard as {"chunks": [...], "documents": {path: [chunk, start, end]}}."""
+    index = {"chunks": [], "documents": {}}
+    with open(f"{filename}{INDEX_SUFFIX}", "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave one truncated final line
+                break
+            if "chunks" in entry:
+                # Backups written before the index was appended per chunk hold it in one object
+                return entry
+            if "chunk" in entry:
+                chunk = len(index["chunks"])
+                index["chunks"].append(entry["chunk"])
+                for path, (start, end) in entry["documents"].items():
+                    index["documents"][path] = [chunk, start, end]
+            else:
+                index.update(entry)
+    return index
+
+def read_archived_document(filename, path):
+    """Read a single document from a chunked archive shard by decompressing only its chunk."""
+    index = load_archive_index(filename)
+    if path not in index["documents"]:
+        return None
+    return next(read_located_records(filename, [index["documents"][path]], index["chunks"]))
+
+def read_located_records(filename, locations, chunks=None):
+    """Yield the records at the given locations of a shard, as stored in its hash tree or index.
+
+    Plain shards are read by byte range; a chunked archive decompresses each chunk
+    that holds one of the records once.
+    """
+    with open(filename, "rb") as f:
+        if not filename.endswith(".gz"):
+            for start, end in sorted(locations):
+                f.seek(start)
+                yield json.loads(f.read(end - start))
+            return
+        if chunks is None:
+            chunks = load_archive_index(filename)["chunks"]
+        by_chunk = {}
+        for chunk, start, end in locations:
+            by_chunk.setdefault(chunk, []).append((start, end))
+        for chunk, ranges in sorted(by_chunk.items()):
+            offset, length = chunks[chunk]
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+            for start, end in ranges:
+                yield json.loads(data[start:end])
+
+def list_shards(directory):
+    """Map shard names to their files in a backup directory."""
+    shards = {}
+    for filename in sorted(os.listdir(directory)):
+        for output_format in BACKUP_FORMATS:
+            if filename.endswith(f".{output_format}"):
+                shards[filename[:-len(output_format) - 1]] = os.path.join(directory, filename)
+                break
+    return shards
+
+def extract_document(directory, path):
+    """Find one document, e.g. "episodes/<id>", in a backup directory."""
+    shards = list_shards(directory)
+    name = ".".join(path.split("/")[0::2])
+    if name not in shards:
+        return None
+    if shards[name].endswith(".gz"):
+        return read_archived_document(shards[name], path)
+    return next((record for record in iter_shard_records(shards[name]) if record['path'] == path), None)
+
+def shard_path(directory, name, output_format):
+    """Return the file path for one collection shard."""
+    return os.path.join(directory, f"{name}.{output_format}")
+
+def change_filter(query, field, since):
+    """Restrict a query to documents whose change field is past the high-water mark."""
+    if not since:
+        return query
+    return query.where(filter=firestore_ops.sdk().FieldFilter(field, ">", datetime.fromisoformat(since)))
+
+def advance_mark(mark, data, field):
+    """Return the newer of the current high-water mark and the document's change field."""
+    value = data.get(field) if field else None
+    if isinstance(value, datetime) and (mark is None or value > mark):
+        return value
+    return mark
+
+def change_time(value):
+    """Return an updatedAt value as an aware datetime, whether read from Firestore or a backup."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value if isinstance(value, datetime) else None
+
+def backup_collection(db, name, directory, output_format, since=None):
+    """Streams one top-level collection into its own shard."""
+    field = CHANGE_FIELDS.get(name)
+    query = change_filter(db.collection(name), field, since)
+    mark = None
+    writer = WRITERS[output_format](shard_path(directory, name, output_format))
+    try:
+        for doc in firestore_ops.stream(query):
+            record = serialize_document(doc)
+            mark = advance_mark(mark, record['data'], field)
+            writer.write(record)
+    finally:
+        writer.close()
+    return [(name, writer.count, mark)]
+
+def backup_subcollection(db, name, parents, directory, output_format, since=None):
+    """Streams a subcollection group once, routing documents into one shard per parent collection."""
+    field = CHANGE_FIELDS.get(name)
+    query = change_filter(db.collection_group(name), field, since)
+    mark = None
+    writers = {}
     try:
-        firebase_admin.get_app()
-    except ValueError:
-        cred = credentials.Certificate("serviceAccountKey.json")
-        firebase_admin.initialize_app(cred)
-    
-    db = firestore.client()
-    
+        for parent in parents:
+            writers[parent] = WRITERS[output_format](shard_path(directory, f"{parent}.{name}", output_format))
+        for doc in firestore_ops.stream(query):
+            parent = doc.reference.path.split("/")[0]
+            if parent in writers:
+                record = serialize_document(doc)
+                mark = advance_mark(mark, record['data'], field)
+                writers[parent].write(record)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [(f"{parent}.{name}", writer.count, mark) for parent, writer in writers.items()]
+
+def load_manifest(path):
+    """Load the backup manifest, or an empty one if no backup has been recorded yet."""
+    if not os.path.exists(path):
+        return {"backups": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    """Atomically replace the backup manifest."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+
+def current_chain(manifest):
+    """Return the latest full backup entry followed by the deltas recorded after it."""
+    backups = manifest["backups"]
+    for i in range(len(backups) - 1, -1, -1):
+        if backups[i]["type"] == "full":
+            return backups[i:]
+    return []
+
+def load_chain(manifest_path):
+    """Return (entry, shards) pairs for the current chain, resolving paths against the manifest."""
+    chain = current_chain(load_manifest(manifest_path))
+    if not chain:
+        raise ValueError(f"No full backup recorded in {manifest_path}")
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    return [(entry, list_shards(os.path.join(base_dir, entry["path"]))) for entry in chain]
+
+def iter_chain_records(shard_files, name):
+    """Yield the current version of every document in one shard of a backup chain.
+
+    The chain is walked newest-first. Only the paths found in the deltas are held in
+    memory; the complete export at the bottom streams through against them.
+    """
+    seen = set()
+    for entry, shards in reversed(shard_files):
+        # Anything older than a complete export of this shard is superseded
+        complete = name in entry.get("fullShards", [])
+        if name in shards:
+            for record in iter_shard_records(shards[name]):
+                if record["path"] in seen:
+                    continue
+                if not complete:
+                    seen.add(record["path"])
+                yield record
+        if complete:
+            break
+
+def iter_backup_records(path):
+    """Yield records from a backup directory, a single shard file or a backup manifest."""
+    if os.path.isdir(path):
+        for filename in list_shards(path).values():
+            yield from iter_shard_records(filename)
+        return
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            is_manifest = f.read(1 << 10).lstrip().startswith("{")
+        if is_manifest:
+            shard_files = load_chain(path)
+            for name in sorted({name for _, shards in shard_files for name in shards}):
+                yield from iter_chain_records(shard_files, name)
+            return
+    yield from iter_shard_records(path)
+
+def iter_collection_records(path, name):
+    """Yield the records of one shard, e.g. "karmaHistory", reading no other shard files."""
+    if os.path.isdir(path):
+        shards = list_shards(path)
+        if name in shards:
+            yield from iter_shard_records(shards[name])
+        return
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            is_manifest = f.read(1 << 10).lstrip().startswith("{")
+        if is_manifest:
+            yield from iter_chain_records(load_chain(path), name)
+            return
+    for record in iter_shard_records(path):
+        if ".".join(record["path"].split("/")[0::2]) == name:
+            yield record
+
+def shard_source(name):
+    """Return the collection or collection-group name whose change field governs a shard."""
+    return name.split(".")[-1]
+
+def discover_collections(db):
+    """List the top-level collections present in the database, leaving out DERIVED_COLLECTIONS."""
+    return sorted(collection.id for collection in firestore_ops.list_collections(db)
+                  if collection.id not in DERIVED_COLLECTIONS)
+
+def discover_subcollections(db, collections, workers=DEFAULT_WORKERS, sample_size=SUBCOLLECTION_SAMPLE):
+    """Map subcollection names to the given collections they live under, starting from SUBCOLLECTIONS.
+
+    The subcollections of the first sample_size documents of every collection are
+    listed, and any not in SUBCOLLECTIONS are reported and added. One that only a
+    few parents further down have can still be missed.
+    """
+    def sample(parent):
+        names = set()
+        for snapshot in firestore_ops.stream(db.collection(parent).select([]).limit(sample_size), "keys"):
+            names.update(subcollection.id for subcollection in firestore_ops.list_collections(snapshot.reference))
+        return parent, names
+
+    groups = {name: [parent for parent in parents if parent in collections] for name, parents in SUBCOLLECTIONS.items()}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for parent, names in executor.map(sample, collections):
+            for name in sorted(names):
+                if parent not in groups.setdefault(name, []):
+                    groups[name].append(parent)
+                    print(f"⚠ {parent}/*/{name} is not in SUBCOLLECTIONS; backing it up as {parent}.{name}")
+    return {name: parents for name, parents in groups.items() if parents}
+
+def backup_firestore(output_format="jsonl", collections=None, workers=DEFAULT_WORKERS,
+                     incremental=False, manifest_path=DEFAULT_MANIFEST):
+    """Backs up every collection concurrently, writing one shard per collection.
+
+    With incremental=True and a previous backup recorded in the manifest, only documents
+    changed since that backup's high-water marks are exported, as a delta chained to it.
+    Returns the backup directory and the number of documents backed up.
+    """
+    db = firestore_ops.client()
+
     print("Starting backup process...")
-    
-    # Get all documents
-    docs = db.collection("episodes").stream()
-    
-    # Convert documents to dictionaries, handling timestamp conversion
-    backup_data = []
-    for doc in docs:
-        doc_dict = doc.to_dict()
-        # Convert any timestamp fields to strings
-        if 'createdAt' in doc_dict and doc_dict['createdAt']:
-            doc_dict['createdAt'] = doc_dict['createdAt'].isoformat()
-        if 'updatedAt' in doc_dict and doc_dict['updatedAt']:
-            doc_dict['updatedAt'] = doc_dict['updatedAt'].isoformat()
-        backup_data.append(doc_dict)
-    
-    # Save to backup file with custom JSON encoder
-    backup_filename = f"firestore_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(backup_filename, "w", encoding="utf-8") as f:
-        json.dump(backup_data, f, default=convert_timestamp, ensure_ascii=False, indent=4)
-    
-    print(f"Backup completed successfully! Saved to {backup_filename}")
-    print(f"Total documents backed up: {len(backup_data)}")
+
+    if not collections:
+        collections = discover_collections(db)
+    print(f"Collections: {', '.join(collections)}")
+
+    manifest = load_manifest(manifest_path)
+    chain = current_chain(manifest)
+    marks = {}
+    if incremental and chain:
+        marks = dict(chain[-1]["highWaterMarks"])
+        print(f"Incremental backup on top of {chain[-1]['path']}")
+    elif incremental:
+        print("No previous full backup in the manifest, taking a full backup")
+    is_delta = bool(incremental and chain)
+
+    backup_dir = f"firestore_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(backup_dir)
+
+    # Each shard is written by its own worker as documents arrive, so the run takes
+    # about as long as the largest collection and memory stays flat
+    totals = {}
+    failed = False
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(backup_collection, db, name, backup_dir, output_format, marks.get(name)): name
+            for name in collections
+        }
+        for name, parents in discover_subcollections(db, collections, workers).items():
+            since = marks.get(f"{parents[0]}.{name}")
+            futures[executor.submit(backup_subcollection, db, name, parents, backup_dir, output_format, since)] = name
+
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"✗ Failed to back up {futures[future]}: {e}")
+                failed = True
+                continue
+            for shard, count, mark in results:
+                print(f"✓ {shard}: {count} documents")
+                totals[shard] = count
+                # Keep the previous mark when nothing changed since it
+                if mark is not None:
+                    marks[shard] = mark.isoformat()
+
+    # Only a complete run may advance the chain, otherwise the next delta would skip
+    # the documents this one failed to read
+    if failed:
+        print(f"Backup incomplete, not recorded in {manifest_path}")
+    else:
+        manifest["backups"].append({
+            "type": "delta" if is_delta else "full",
+            # Relative to the manifest, so the whole backup tree can be moved
+            "path": os.path.relpath(backup_dir, os.path.dirname(os.path.abspath(manifest_path))),
+            "base": chain[-1]["path"] if is_delta else None,
+            "createdAt": datetime.now().isoformat(),
+            "format": output_format,
+            "highWaterMarks": marks,
+            # Shards without a change field are complete in every delta
+            "fullShards": sorted(
+                shard for shard in totals
+                if not is_delta or shard_source(shard) not in CHANGE_FIELDS
+            ),
+        })
+        save_manifest(manifest_path, manifest)
+
+    print(f"Backup completed successfully! Saved to {backup_dir}")
+    print(f"Total documents backed up: {sum(totals.values())}")
+    return backup_dir, sum(totals.values())
+
+def replay_chain(manifest_path=DEFAULT_MANIFEST, output_format="jsonl"):
+    """Replays the latest full backup and its deltas into one consolidated snapshot."""
+    shard_files = load_chain(manifest_path)
+
+    output_dir = f"{os.path.basename(shard_files[-1][0]['path'])}_replayed"
+    os.makedirs(output_dir)
+    print(f"Replaying {len(shard_files)} backups into {output_dir}...")
+
+    names = sorted({name for _, shards in shard_files for name in shards})
+    for name in names:
+        writer = WRITERS[output_format](shard_path(output_dir, name, output_format))
+        try:
+            for record in iter_chain_records(shard_files, name):
+                writer.write(record)
+        finally:
+            writer.close()
+        print(f"✓ {name}: {writer.count} documents")
+
+    print(f"Replay completed! Saved to {output_dir}")
+    return output_dir
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Back up Firestore collections.")
+    parser.add_argument("--format", choices=BACKUP_FORMATS, default="jsonl",
+                        help="jsonl writes one document per line, json writes an incrementally built array, "
+                             "jsonl.gz writes gzipped chunks with a per-document index")
+    parser.add_argument("--collections", nargs="+",
+                        help="collections to back up (default: every top-level collection)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of collections exported concurrently")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only export documents changed since the last backup in the manifest")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST,
+                        help="manifest file recording the backup chain and its high-water marks")
+    parser.add_argument("--replay", action="store_true",
+                        help="consolidate the latest full backup and its deltas instead of backing up")
+    parser.add_argument("--extract", nargs=2, metavar=("BACKUP_DIR", "DOC_PATH"),
+                        help="print a single document, e.g. episodes/<id>, from a backup")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    backup_firestore()
\ No newline at end of file
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    if args.extract:
+        record = extract_document(*args.extract)
+        if record is None:
+            print(f"Document {args.extract[1]} not found in {args.extract[0]}")
+        else:
+            print(json.dumps(record, ensure_ascii=False, indent=4))
+    elif args.replay:
+        replay_chain(args.manifest, args.format)
+    else:
+        backup_firestore(args.format, args.collections, args.workers, args.incremental, args.manifest)
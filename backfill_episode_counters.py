@@ -0,0 +1,144 @@
+import argparse
+from array import array
+
+import numpy as np
+
+import firestore_ops
+from firestore_batches import DEFAULT_WORKERS, write_in_batches
+
+COUNTER_FIELDS = [
+    'factCheckCount',
+    'validatedFactCheckCount',
+    'controversialFactCheckCount',
+    'totalFactCheckScore',
+    'topFactChecks'
+]
+# Statuses counted as validated; controversial fact checks are counted separately
+VALIDATED_STATUSES = ('VALIDATED_TRUE', 'VALIDATED_FALSE')
+CONTROVERSIAL_STATUS = 'VALIDATED_CONTROVERSIAL'
+TOP_FACT_CHECKS = 3
+
+class FactCheckTable:
+    """Columnar, in-memory table of the fact check fields the counters depend on.
+
+    Episode IDs are factorized into integer codes while streaming, so the
+    aggregation is a handful of NumPy passes over flat arrays.
+    """
+
+    def __init__(self):
+        self.episode_codes = {}
+        self.episode = array('i')
+        self.validated = array('b')
+        self.controversial = array('b')
+        self.votes = array('d')
+        self.ids = []
+
+    def append(self, fact_check_id, episode_id, status, vote_count):
+        code = self.episode_codes.setdefault(episode_id, len(self.episode_codes))
+        self.episode.append(code)
+        self.validated.append(status in VALIDATED_STATUSES)
+        self.controversial.append(status == CONTROVERSIAL_STATUS)
+        self.votes.append(vote_count or 0)
+        self.ids.append(fact_check_id)
+
+    def aggregate(self):
+        """Compute every per-episode counter and top list in one group-by pass."""
+        groups = len(self.episode_codes)
+        episode = np.frombuffer(self.episode, dtype=np.int32)
+        votes = np.frombuffer(self.votes, dtype=np.float64)
+
+        counts = np.bincount(episode, minlength=groups)
+        validated = np.bincount(episode, weights=np.frombuffer(self.validated, dtype=np.int8), minlength=groups)
+        controversial = np.bincount(episode, weights=np.frombuffer(self.controversial, dtype=np.int8),
+                                    minlength=groups)
+        scores = np.bincount(episode, weights=votes, minlength=groups)
+
+        # Sort by episode, then by votes descending; each group's first rows are its top fact checks
+        order = np.lexsort((-votes, episode))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        ids = np.array(self.ids, dtype=object)[order]
+
+        aggregates = {}
+        for episode_id, code in self.episode_codes.items():
+            start = starts[code]
+            aggregates[episode_id] = {
+                'factCheckCount': int(counts[code]),
+                'validatedFactCheckCount': int(validated[code]),
+                'controversialFactCheckCount': int(controversial[code]),
+                'totalFactCheckScore': as_number(scores[code]),
+                'topFactChecks': list(ids[start:start + min(TOP_FACT_CHECKS, counts[code])])
+            }
+        return aggregates
+
+def as_number(value):
+    """Store whole scores as integers, like the app's increments do."""
+    return int(value) if float(value).is_integer() else float(value)
+
+def load_fact_checks(db):
+    """Stream the projected factChecks fields into a FactCheckTable."""
+    table = FactCheckTable()
+    for doc in firestore_ops.stream(db.collection('factChecks').select(['episodeId', 'status', 'voteCount'])):
+        data = doc.to_dict()
+        if data.get('episodeId'):
+            table.append(doc.id, data['episodeId'], data.get('status'), data.get('voteCount'))
+    return table
+
+def counter_updates(db, aggregates, stats):
+    """Yield updates for the episodes whose stored counters differ from the recomputed ones."""
+    empty = {
+        'factCheckCount': 0,
+        'validatedFactCheckCount': 0,
+        'controversialFactCheckCount': 0,
+        'totalFactCheckScore': 0,
+        'topFactChecks': []
+    }
+    firestore = firestore_ops.sdk()
+    for doc in firestore_ops.stream(db.collection('episodes').select(COUNTER_FIELDS)):
+        stored = doc.to_dict()
+        expected = aggregates.pop(doc.id, empty)
+        changes = {field: value for field, value in expected.items() if stored.get(field) != value}
+        if not changes:
+            stats['unchanged'] += 1
+            continue
+        stats['changed'] += 1
+        yield ("update", doc.reference.path, {**changes, 'updatedAt': firestore.SERVER_TIMESTAMP})
+    # Whatever is left refers to episodes that no longer exist
+    stats['orphaned'] = len(aggregates)
+
+def backfill_episode_counters(workers=DEFAULT_WORKERS, dry_run=False):
+    """Recomputes episode fact check counters and writes only the ones that changed."""
+    print("Starting counter backfill...")
+    db = firestore_ops.client()
+
+    table = load_fact_checks(db)
+    print(f"✓ Loaded {len(table.ids)} fact checks for {len(table.episode_codes)} episodes")
+    aggregates = table.aggregate()
+
+    stats = {'changed': 0, 'unchanged': 0}
+    updates = counter_updates(db, aggregates, stats)
+    if dry_run:
+        for _, path, changes in updates:
+            print(f"  {path}: {sorted(field for field in changes if field != 'updatedAt')}")
+    else:
+        written, failed = write_in_batches(db, updates, workers, label="Updated")
+        if failed:
+            print(f"✗ Failed to update {failed} episodes")
+
+    print(f"✓ {stats['changed']} episodes changed, {stats['unchanged']} unchanged")
+    if stats['orphaned']:
+        print(f"Fact checks reference {stats['orphaned']} episodes that do not exist")
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recompute episode fact check counters from factChecks.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="list the episodes that would change without writing")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    backfill_episode_counters(args.workers, args.dry_run)
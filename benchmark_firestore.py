@@ -0,0 +1,248 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import urllib.request
+from datetime import datetime
+from queue import Empty
+
+from firestore_batches import DEFAULT_WORKERS
+from generate_dataset import DEFAULT_SEED, scaled_config, write_episodes
+
+DEFAULT_RESULTS_FILE = "benchmark_results.jsonl"
+STEPS = ("seed", "ingest", "backup", "restore", "cleanup")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# How often a waiting benchmark checks that the step's process is still alive
+POLL_SECONDS = 1
+
+def clear_emulator(host, project_id):
+    """Delete every document in the emulator's default database."""
+    request = urllib.request.Request(
+        f"http://{host}/emulator/v1/projects/{project_id}/databases/(default)/documents", method="DELETE"
+    )
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _measure(queue, workdir, function, args):
+    """Run one step in this (child) process and report its time, peak RSS and Firestore operations.
+
+    A step returns a dict with the number of documents it processed under "documents",
+    plus anything later steps need.
+    """
+    import firestore_ops
+
+    # Backups, plans and manifests land in the scratch directory, and the lack of a
+    # service account key there makes the client connect without credentials
+    os.chdir(workdir)
+    # A forked child starts with the parent's counters
+    firestore_ops.stats = firestore_ops.OpStats()
+    start = time.perf_counter()
+    try:
+        result = dict(function(*args))
+    except Exception:
+        result = {"error": traceback.format_exc()}
+    result["seconds"] = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peakRssMb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    result["firestore"] = firestore_ops.stats.summary()
+    queue.put(result)
+
+def run_step(workdir, function, *args):
+    """Run a step in a fresh process, so its peak RSS and operation counts are its own.
+
+    A process that dies without reporting, e.g. killed for running out of memory,
+    is recorded as a failed step instead of leaving the benchmark waiting forever.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(queue, workdir, function, args))
+    start = time.perf_counter()
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=POLL_SECONDS)
+        except Empty:
+            if process.is_alive():
+                continue
+            # A result put just before exiting is already in the pipe
+            try:
+                result = queue.get(timeout=POLL_SECONDS)
+            except Empty:
+                result = {"error": f"Step process exited with code {process.exitcode} without reporting a result",
+                          "documents": None, "seconds": time.perf_counter() - start, "peakRssMb": None,
+                          "firestore": None}
+    process.join()
+    return result
+
+def seed_step(config, seed, workers):
+    import firestore_ops
+    from generate_dataset import seed_firestore
+
+    return {"documents": seed_firestore(firestore_ops.client(), config, seed, workers)}
+
+def ingest_step(episodes_file, workers):
+    import firestore_ops
+    from setup_firebase import update_episodes_structure
+
+    written = update_episodes_structure(firestore_ops.client(), episodes_file, workers, shard_transcripts=True)
+    return {"documents": written}
+
+def backup_step(workers):
+    from back_up_firestore import backup_firestore
+
+    backup_dir, documents = backup_firestore(workers=workers, manifest_path="backup_manifest.json")
+    return {"documents": documents, "backupDir": backup_dir}
+
+def restore_step(backup_dir, workers):
+    from restore_firestore import restore_firestore
+
+    written, failed = restore_firestore(backup_dir, workers=workers, writes_per_second=0)
+    if failed:
+        raise RuntimeError(f"{failed} documents failed to restore")
+    return {"documents": written}
+
+def cleanup_step(workers):
+    from cleanup_firestore import cleanup_firestore
+
+    return {"documents": cleanup_firestore(workers, "cleanup_plan.json")}
+
+def step_summary(result):
+    """Condense a step's raw measurement into the fields kept in the results file."""
+    firestore = result["firestore"] or {"reads": 0, "writes": 0, "deletes": 0, "calls": {}}
+    documents = result.get("documents")
+    summary = {
+        "seconds": round(result["seconds"], 3),
+        "documents": documents,
+        "docsPerSecond": round(documents / result["seconds"], 1) if documents and result["seconds"] else None,
+        "peakRssMb": result["peakRssMb"],
+        "reads": firestore["reads"],
+        "writes": firestore["writes"],
+        "deletes": firestore["deletes"],
+        "calls": {call: {key: stats[key] for key in ("count", "errors", "seconds", "histogram")}
+                  for call, stats in firestore["calls"].items()},
+    }
+    if "error" in result:
+        summary["error"] = result["error"].strip().splitlines()[-1]
+    return summary
+
+def previous_run(results_file, run):
+    """Return the latest earlier run with the same seed and dataset, for comparison."""
+    if not os.path.exists(results_file):
+        return None
+    previous = None
+    with open(results_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            candidate = json.loads(line)
+            if candidate["seed"] == run["seed"] and candidate["config"] == run["config"]:
+                previous = candidate
+    return previous
+
+def print_report(run, previous):
+    print(f"\n{'step':<8} {'seconds':>9} {'docs/s':>10} {'peak MB':>8} {'reads':>9} {'writes':>9} {'deletes':>8}"
+          f"{'  vs ' + (previous['revision'] or previous['startedAt']) if previous else ''}")
+    for step, summary in run["steps"].items():
+        change = ""
+        before = previous["steps"].get(step) if previous else None
+        if before and before.get("seconds") and "error" not in before:
+            change = f"  {(summary['seconds'] / before['seconds'] - 1) * 100:+.1f}% time"
+        if "error" in summary:
+            change = f"  FAILED: {summary['error']}"
+        print(f"{step:<8} {summary['seconds']:>9.2f} {summary['docsPerSecond'] or 0:>10.0f} "
+              f"{summary['peakRssMb'] or 0:>8.1f} {summary['reads']:>9} {summary['writes']:>9} "
+              f"{summary['deletes']:>8}{change}")
+
+def benchmark(emulator, config, seed=DEFAULT_SEED, workers=DEFAULT_WORKERS, steps=STEPS,
+              results_file=DEFAULT_RESULTS_FILE, project_id=None):
+    """Time the maintenance scripts against a freshly seeded emulator and append the results.
+
+    Every step runs in its own process, after the one before it: seeding the social
+    collections, ingesting the episodes, a full backup, restoring that backup into
+    an emptied database, and merging the duplicate episodes.
+    """
+    import firestore_ops
+
+    # Never let a benchmark touch the live project
+    os.environ["FIRESTORE_EMULATOR_HOST"] = emulator
+    project_id = project_id or firestore_ops.EMULATOR_PROJECT_ID
+    os.environ["GCLOUD_PROJECT"] = project_id
+    results_file = os.path.abspath(results_file)
+    run = {
+        "startedAt": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "seed": seed,
+        "workers": workers,
+        "config": config,
+        "steps": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="firestore_benchmark_") as workdir:
+        episodes_file = os.path.join(workdir, "episodes.jsonl")
+        print(f"Generating {config['episodes']} episodes with seed {seed}...")
+        write_episodes(episodes_file, config, seed)
+        clear_emulator(emulator, project_id)
+
+        backup_dir = None
+        for step in steps:
+            print(f"\n=== {step} ===")
+            if step == "seed":
+                result = run_step(workdir, seed_step, config, seed, workers)
+            elif step == "ingest":
+                result = run_step(workdir, ingest_step, episodes_file, workers)
+            elif step == "backup":
+                result = run_step(workdir, backup_step, workers)
+                backup_dir = result.get("backupDir")
+            elif step == "restore":
+                if not backup_dir:
+                    print("Skipping restore, there is no backup from this run")
+                    continue
+                clear_emulator(emulator, project_id)
+                result = run_step(workdir, restore_step, os.path.join(workdir, backup_dir), workers)
+            else:
+                result = run_step(workdir, cleanup_step, workers)
+            if "error" in result:
+                print(result["error"])
+            run["steps"][step] = step_summary(result)
+
+    previous = previous_run(results_file, run)
+    with open(results_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run, separators=(",", ":")) + "\n")
+    print_report(run, previous)
+    print(f"\nResults appended to {results_file}")
+    return run
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the maintenance scripts against the Firestore emulator.")
+    parser.add_argument("--emulator", metavar="HOST:PORT", required=True,
+                        help="Firestore emulator to seed and benchmark against; it is wiped first")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="dataset seed")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the number of episodes and users")
+    parser.add_argument("--transcript-entries", type=int, help="transcript entries per episode")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="worker count passed to every step")
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=list(STEPS),
+                        help="steps to run, in order (default: all)")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_FILE,
+                        help="JSON Lines file the run is appended to and compared against")
+    parser.add_argument("--project", help="emulator project ID (default: the credential-less emulator project)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = scaled_config(args.scale, transcriptEntries=args.transcript_entries)
+    benchmark(args.emulator, config, args.seed, args.workers, args.steps, args.results, args.project)
@@ -0,0 +1,580 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+from array import array
+from datetime import datetime
+
+import numpy as np
+
+import firestore_ops
+from back_up_firestore import iter_collection_records, change_filter, change_time
+from firestore_batches import DEFAULT_WORKERS, split_utf8, write_in_batches
+from setup_firebase import time_to_seconds
+
+INDEX_VERSION = 3
+DEFAULT_OUTPUT_DIR = os.path.join("public", "search-index")
+# Outside the published directory, so the builder state is never deployed
+DEFAULT_STATE_FILE = ".search_index_state.json"
+INDEX_COLLECTION = "searchIndex"
+INDEX_DOCUMENT = "_index"
+STATE_DOCUMENT = "_state"
+# Shards get a longer term prefix until their JSON fits, so a lookup stays a small fetch
+MAX_SHARD_BYTES = 256 * 1024
+# Firestore documents are capped at 1 MiB, so larger shards are stored in several parts
+MAX_PART_BYTES = 900 * 1024
+# Size-tiered merging: segments within the same power-of-MERGE_FACTOR size tier are
+# merged once MERGE_FACTOR of them have accumulated; anything below MIN_TIER_BYTES
+# counts as the smallest tier
+MERGE_FACTOR = 4
+MIN_TIER_BYTES = 4 * 1024
+# Position recorded for title and guest matches; it sorts ahead of every transcript time
+METADATA_POSITION = -1
+EPISODE_FIELDS = ['title', 'guest', 'date', 'transcript', 'transcriptChunks', 'contentHashes', 'updatedAt']
+# Fields whose content hashes decide whether an updated episode needs re-indexing
+INDEXED_FIELDS = ('title', 'guest', 'date', 'transcript')
+
+TOKEN = re.compile(r"[a-z0-9]+")
+# Too common in transcripts to be worth their postings; still indexed in titles and guests
+STOP_WORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "i", "if", "in", "is", "it",
+    "of", "on", "or", "so", "that", "the", "this", "to", "was", "we", "with", "you"
+])
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric terms, matching the search page."""
+    return TOKEN.findall(text.lower()) if text else []
+
+def decode_postings(postings):
+    """Yield (doc, position) pairs from a term's encoded postings."""
+    doc = 0
+    i = 0
+    while i < len(postings):
+        doc = postings[i] if i == 0 else doc + postings[i]
+        count = postings[i + 1]
+        position = 0
+        for k in range(count):
+            position = postings[i + 2] if k == 0 else position + postings[i + 2 + k]
+            yield doc, position
+        i += 2 + count
+
+class PostingsTable:
+    """Columnar (term, document, position) table that encodes into an inverted index.
+
+    Positions are transcript seconds, or METADATA_POSITION for title and guest
+    matches. Terms are factorized into integer codes while streaming, and the
+    postings are sorted, deduplicated and delta-encoded with NumPy at the end.
+    Document numbers index the segment's own docs table.
+    """
+
+    def __init__(self):
+        self.term_codes = {}
+        self.term = array('i')
+        self.doc = array('i')
+        self.position = array('i')
+        self.docs = []
+        self.doc_numbers = {}
+
+    def add(self, term, doc, position):
+        self.term.append(self.term_codes.setdefault(term, len(self.term_codes)))
+        self.doc.append(doc)
+        self.position.append(position)
+
+    def add_episode(self, doc_id, data):
+        """Register an episode's result metadata and index its title and guest."""
+        doc = self.doc_numbers[doc_id] = len(self.docs)
+        self.docs.append([doc_id, data.get('title', ''), data.get('guest', ''), data.get('date', '')])
+        for term in set(tokenize(data.get('title')) + tokenize(data.get('guest'))):
+            self.add(term, doc, METADATA_POSITION)
+        return doc
+
+    def add_entries(self, doc_id, entries):
+        """Index transcript entries at their start time in seconds."""
+        doc = self.doc_numbers.get(doc_id)
+        if doc is None:
+            return
+        for entry in entries:
+            seconds = time_to_seconds(entry.get('time', ''))
+            for term in set(tokenize(entry.get('text'))) - STOP_WORDS:
+                self.add(term, doc, seconds)
+
+    def add_postings(self, term, postings, numbers):
+        """Add already encoded postings from a segment being merged.
+
+        numbers maps the segment's document numbers to this table's; documents
+        missing from it are dead and dropped.
+        """
+        for doc, position in decode_postings(postings):
+            if doc in numbers:
+                self.add(term, numbers[doc], position)
+
+    def postings(self):
+        """Encode the table into {term: postings}.
+
+        A term's postings are a flat list of [docDelta, count, position, positionDelta...]
+        groups, one per document. Document numbers are delta-encoded across a term's
+        groups and positions within a group; the first value of each run is absolute.
+        """
+        if not self.term:
+            return {}
+        term = np.frombuffer(self.term, dtype=np.int32)
+        doc = np.frombuffer(self.doc, dtype=np.int32)
+        position = np.frombuffer(self.position, dtype=np.int32)
+
+        order = np.lexsort((position, doc, term))
+        term, doc, position = term[order], doc[order], position[order]
+        unique = np.ones(len(term), dtype=bool)
+        unique[1:] = (np.diff(term) != 0) | (np.diff(doc) != 0) | (np.diff(position) != 0)
+        term, doc, position = term[unique], doc[unique], position[unique]
+
+        new_term = np.ones(len(term), dtype=bool)
+        new_term[1:] = term[1:] != term[:-1]
+        new_doc = new_term.copy()
+        new_doc[1:] |= doc[1:] != doc[:-1]
+
+        position_delta = position.copy()
+        position_delta[1:] -= np.where(new_doc[1:], 0, position[:-1])
+
+        # Every document group gets a two-value header in front of its positions
+        group_starts = np.flatnonzero(new_doc)
+        group_of_row = np.cumsum(new_doc) - 1
+        header_at = group_starts + 2 * np.arange(len(group_starts))
+        encoded = np.empty(len(term) + 2 * len(group_starts), dtype=np.int64)
+        encoded[np.arange(len(term)) + 2 * (group_of_row + 1)] = position_delta
+        group_docs = doc[group_starts]
+        doc_delta = group_docs.copy()
+        doc_delta[1:] -= np.where(new_term[group_starts][1:], 0, group_docs[:-1])
+        encoded[header_at] = doc_delta
+        encoded[header_at + 1] = np.diff(np.append(group_starts, len(term)))
+
+        terms = {code: term_text for term_text, code in self.term_codes.items()}
+        term_starts = np.flatnonzero(new_term)
+        bounds = np.append(header_at[group_of_row[term_starts]], len(encoded))
+        return {
+            terms[int(term[row])]: encoded[bounds[i]:bounds[i + 1]].tolist()
+            for i, row in enumerate(term_starts)
+        }
+
+def content_signature(data):
+    """Fingerprint the indexed fields from the episode's stored content hashes, if it has them."""
+    hashes = data.get('contentHashes')
+    if not hashes:
+        return None
+    return hashlib.sha256(
+        json.dumps([hashes.get(field) for field in INDEXED_FIELDS]).encode("utf-8")
+    ).hexdigest()[:16]
+
+def episode_documents(db, backup_path, since=None):
+    """Yield (id, data) for every episode updated after since, projected to the fields the index needs."""
+    if backup_path:
+        mark = change_time(since)
+        for record in iter_collection_records(backup_path, 'episodes'):
+            updated = change_time(record['data'].get('updatedAt'))
+            if mark is None or (updated is not None and updated > mark):
+                yield record['id'], {**record['data'], 'updatedAt': updated}
+    else:
+        query = change_filter(db.collection('episodes'), 'updatedAt', since)
+        for doc in firestore_ops.stream(query.select(EPISODE_FIELDS)):
+            yield doc.id, doc.to_dict()
+
+def episode_ids(db, backup_path):
+    """List every existing episode ID, with a key-only query when reading Firestore."""
+    if backup_path:
+        return {record['id'] for record in iter_collection_records(backup_path, 'episodes')}
+    return {snapshot.id for snapshot in firestore_ops.stream(db.collection('episodes').select([]), "keys")}
+
+def chunk_entries(db, backup_path, doc_id=None):
+    """Yield (episodeId, entries) for transcriptChunks documents.
+
+    From a backup the whole chunk shard is streamed; from Firestore only the
+    chunks of the given episode are read.
+    """
+    if backup_path:
+        for record in iter_collection_records(backup_path, 'episodes.transcriptChunks'):
+            yield record['path'].split("/")[1], record['data'].get('entries', [])
+    else:
+        chunks = db.collection('episodes').document(doc_id).collection('transcriptChunks')
+        for doc in firestore_ops.stream(chunks.select(['entries'])):
+            yield doc_id, doc.to_dict().get('entries', [])
+
+def encoded_size(term, postings):
+    return len(term) + len(json.dumps(postings, separators=(",", ":"))) + 4
+
+def plan_shards(postings, prefix="", max_bytes=MAX_SHARD_BYTES):
+    """Assign terms to shards keyed by term prefix, splitting a prefix further while it is too large.
+
+    A term lives in the shard with the longest prefix it starts with, which is how
+    clients locate it.
+    """
+    shards = {}
+    groups = {}
+    for term in postings:
+        if len(term) > len(prefix):
+            groups.setdefault(term[:len(prefix) + 1], []).append(term)
+        else:
+            shards.setdefault(prefix, []).append(term)
+    for child, terms in groups.items():
+        size = sum(encoded_size(term, postings[term]) for term in terms)
+        if size > max_bytes and any(len(term) > len(child) for term in terms):
+            shards.update(plan_shards({term: postings[term] for term in terms}, child, max_bytes))
+        else:
+            shards[child] = terms
+    return shards
+
+def shard_json(postings, terms):
+    return json.dumps({term: postings[term] for term in sorted(terms)}, separators=(",", ":"))
+
+class StaticIndexStore:
+    """Keeps the index as files: index.json plus segments/<id>/<prefix>.json.
+
+    The builder state is kept in a separate file outside the published directory.
+    """
+
+    def __init__(self, output_dir, state_path=DEFAULT_STATE_FILE):
+        self.output_dir = output_dir
+        self.index_path = os.path.join(output_dir, "index.json")
+        self.state_path = state_path
+        # Earlier versions kept the state inside the output directory
+        self.legacy_state_path = os.path.join(output_dir, f"{STATE_DOCUMENT}.json")
+
+    def load_json(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_json(self, path, data):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+
+    def load_index(self):
+        return self.load_json(self.index_path)
+
+    def save_index(self, index):
+        self.save_json(self.index_path, index)
+
+    def load_state(self):
+        state = self.load_json(self.state_path)
+        return state if state is not None else self.load_json(self.legacy_state_path)
+
+    def save_state(self, state):
+        self.save_json(self.state_path, state)
+        legacy = self.legacy_state_path
+        if os.path.exists(legacy) and os.path.abspath(legacy) != os.path.abspath(self.state_path):
+            os.remove(legacy)
+
+    def list_segments(self):
+        """Return the IDs of every segment on disk, referenced by the index or not."""
+        segments_dir = os.path.join(self.output_dir, "segments")
+        if not os.path.isdir(segments_dir):
+            return set()
+        return {name for name in os.listdir(segments_dir) if name.isdigit()}
+
+    def write_segment(self, segment_id, shards):
+        """Write {prefix: shard JSON} and return {prefix: part count}."""
+        segment_dir = os.path.join(self.output_dir, "segments", segment_id)
+        os.makedirs(segment_dir, exist_ok=True)
+        for prefix, data in shards.items():
+            with open(os.path.join(segment_dir, f"{prefix}.json"), "w", encoding="utf-8") as f:
+                f.write(data)
+        return {prefix: 1 for prefix in shards}
+
+    def read_shard(self, segment_id, prefix, parts):
+        with open(os.path.join(self.output_dir, "segments", segment_id, f"{prefix}.json"), "r",
+                  encoding="utf-8") as f:
+            return json.load(f)
+
+    def remove_segments(self, segment_ids):
+        for segment_id in segment_ids:
+            shutil.rmtree(os.path.join(self.output_dir, "segments", segment_id), ignore_errors=True)
+
+    def remove_legacy_shards(self, previous):
+        """Remove the shards/ directory of a version 1 index."""
+        shutil.rmtree(os.path.join(self.output_dir, "shards"), ignore_errors=True)
+
+class FirestoreIndexStore:
+    """Keeps the index in the searchIndex collection.
+
+    The index itself is searchIndex/_index, the builder state searchIndex/_state,
+    and each shard is stored as one or more searchIndex/<segment>.<prefix>.<part>
+    documents holding a slice of its JSON.
+    """
+
+    def __init__(self, db, workers=DEFAULT_WORKERS):
+        self.db = db
+        self.workers = workers
+        self.collection = db.collection(INDEX_COLLECTION)
+
+    def load_index(self):
+        snapshot = firestore_ops.get(self.collection.document(INDEX_DOCUMENT))
+        fields = snapshot.to_dict() or {}
+        # A version 1 index kept its metadata in the fields themselves, with no data string
+        return json.loads(fields['data']) if fields.get('data') else fields or None
+
+    def save_index(self, index):
+        # Stored as a JSON string, since Firestore arrays cannot nest the docs tables
+        firestore_ops.set_document(self.collection.document(INDEX_DOCUMENT),
+                                   {'data': json.dumps(index, separators=(",", ":"))})
+
+    def load_state(self):
+        snapshot = firestore_ops.get(self.collection.document(STATE_DOCUMENT))
+        data = (snapshot.to_dict() or {}).get('data')
+        return json.loads(data) if data else None
+
+    def save_state(self, state):
+        firestore_ops.set_document(self.collection.document(STATE_DOCUMENT),
+                                   {'data': json.dumps(state, separators=(",", ":"))})
+
+    def list_segments(self):
+        # Version 1 shards are <prefix>.<part>, without a segment ID in front
+        ids = (snapshot.id for snapshot in firestore_ops.stream(self.collection.select([]), "keys"))
+        return {doc_id.split(".")[0] for doc_id in ids if doc_id.count(".") == 2 and doc_id.split(".")[0].isdigit()}
+
+    def write_segment(self, segment_id, shards):
+        parts = {}
+        operations = []
+        for prefix, data in shards.items():
+            slices = split_utf8(data, MAX_PART_BYTES)
+            parts[prefix] = len(slices)
+            operations += [("set", f"{INDEX_COLLECTION}/{segment_id}.{prefix}.{part}", {'data': piece})
+                           for part, piece in enumerate(slices)]
+        written, failed = write_in_batches(self.db, operations, self.workers, label="Published")
+        if failed:
+            raise RuntimeError(f"{failed} shard documents of segment {segment_id} failed to write")
+        return parts
+
+    def read_shard(self, segment_id, prefix, parts):
+        refs = [self.collection.document(f"{segment_id}.{prefix}.{part}") for part in range(parts)]
+        snapshots = {snapshot.id: snapshot for snapshot in firestore_ops.get_all(self.db, refs)}
+        return json.loads("".join(snapshots[ref.id].get('data') for ref in refs))
+
+    def remove_segments(self, segment_ids):
+        prefixes = tuple(f"{segment_id}." for segment_id in segment_ids)
+        stale = [("delete", snapshot.reference.path, None)
+                 for snapshot in firestore_ops.stream(self.collection.select([]), "keys")
+                 if snapshot.id.startswith(prefixes)]
+        write_in_batches(self.db, stale, self.workers, label="Removed")
+
+    def remove_legacy_shards(self, previous):
+        """Delete the searchIndex/<prefix>.<part> documents of a version 1 index."""
+        stale = [("delete", f"{INDEX_COLLECTION}/{prefix}.{part}", None)
+                 for prefix, parts in (previous.get('shards') or {}).items() for part in range(parts)]
+        write_in_batches(self.db, stale, self.workers, label="Removed")
+
+def new_index():
+    return {
+        'version': INDEX_VERSION,
+        'stopWords': sorted(STOP_WORDS),
+        # Each segment carries the result metadata of its documents; superseded or
+        # deleted episodes are null until the segment is merged
+        'segments': [],
+        'nextSegment': 0
+    }
+
+def new_state():
+    return {
+        # Live episode ID -> [segment ID, document number in that segment, content signature]
+        'live': {},
+        'highWaterMark': None
+    }
+
+def save_index(store, index, state):
+    """Save the index, then the builder state that points into it.
+
+    The state records which index it belongs to, so a run interrupted between the
+    two saves is detected and rebuilt.
+    """
+    index['createdAt'] = datetime.now().isoformat()
+    state['indexCreatedAt'] = index['createdAt']
+    store.save_index(index)
+    store.save_state(state)
+
+def write_segment(store, index, postings, docs):
+    """Shard postings into a new segment and return its index entry."""
+    segment_id = f"{index['nextSegment']:06d}"
+    index['nextSegment'] += 1
+    shards = {prefix: shard_json(postings, terms) for prefix, terms in plan_shards(postings).items()}
+    return {
+        'id': segment_id,
+        'bytes': sum(len(data) for data in shards.values()),
+        'termCount': len(postings),
+        'createdAt': datetime.now().isoformat(),
+        'docs': docs,
+        'shards': store.write_segment(segment_id, shards)
+    }
+
+def size_tier(segment):
+    return int(math.log(max(segment['bytes'], MIN_TIER_BYTES) / MIN_TIER_BYTES, MERGE_FACTOR))
+
+def plan_merges(segments):
+    """Group segments by size tier and return the groups that are due for a merge."""
+    tiers = {}
+    for segment in segments:
+        tiers.setdefault(size_tier(segment), []).append(segment)
+    return [sorted(group, key=lambda segment: segment['id'])
+            for group in tiers.values() if len(group) >= MERGE_FACTOR]
+
+def merge_segments(store, index, state):
+    """Merge size tiers that filled up, dropping tombstoned documents and their postings.
+
+    The merged segment's docs table holds only the live documents, renumbered from
+    zero. It replaces its inputs in the index before their files are removed, so
+    readers never see a missing shard. Returns the number of merges.
+    """
+    merges = 0
+    while True:
+        groups = plan_merges(index['segments'])
+        if not groups:
+            return merges
+        for group in groups:
+            table = PostingsTable()
+            docs = []
+            # (segment ID, old document number) -> merged document number
+            renumbered = {}
+            for segment in group:
+                numbers = {}
+                for doc, entry in enumerate(segment['docs']):
+                    if entry is not None:
+                        numbers[doc] = renumbered[(segment['id'], doc)] = len(docs)
+                        docs.append(entry)
+                for prefix, parts in segment['shards'].items():
+                    for term, postings in store.read_shard(segment['id'], prefix, parts).items():
+                        table.add_postings(term, postings, numbers)
+            merged = write_segment(store, index, table.postings(), docs)
+            merged_ids = {segment['id'] for segment in group}
+            position = min(i for i, segment in enumerate(index['segments']) if segment['id'] in merged_ids)
+            remaining = [segment for segment in index['segments'] if segment['id'] not in merged_ids]
+            index['segments'] = remaining[:position] + [merged] + remaining[position:]
+            for entry in state['live'].values():
+                if entry[0] in merged_ids:
+                    entry[:2] = [merged['id'], renumbered[(entry[0], entry[1])]]
+            save_index(store, index, state)
+            store.remove_segments(merged_ids)
+            merges += 1
+            print(f"✓ Merged segments {sorted(merged_ids)} into {merged['id']} "
+                  f"({merged['bytes']} bytes, {len(docs)} episodes)")
+
+def index_changes(db, backup_path, index, state, stats):
+    """Index episodes updated since the last run into a PostingsTable for the next segment.
+
+    Episodes whose indexed fields are unchanged (by content hash) are skipped, and
+    the previous version of a re-indexed or deleted episode is tombstoned.
+    """
+    table = PostingsTable()
+    segment_id = f"{index['nextSegment']:06d}"
+    # Tombstoning nulls out an entry's result metadata, so readers skip its postings
+    docs = {segment['id']: segment['docs'] for segment in index['segments']}
+    docs[segment_id] = table.docs
+    mark = change_time(state['highWaterMark'])
+    for doc_id, data in episode_documents(db, backup_path, state['highWaterMark']):
+        updated = change_time(data.get('updatedAt'))
+        if updated is not None and (mark is None or updated > mark):
+            mark = updated
+        signature = content_signature(data)
+        current = state['live'].get(doc_id)
+        if current and signature and current[2] == signature:
+            stats['unchanged'] += 1
+            continue
+        if current:
+            docs[current[0]][current[1]] = None
+        state['live'][doc_id] = [segment_id, table.add_episode(doc_id, data), signature]
+        stats['indexed'] += 1
+        table.add_entries(doc_id, data.get('transcript', []))
+        if not backup_path and data.get('transcriptChunks'):
+            for _, entries in chunk_entries(db, None, doc_id):
+                table.add_entries(doc_id, entries)
+    if backup_path and table.docs:
+        for doc_id, entries in chunk_entries(db, backup_path):
+            table.add_entries(doc_id, entries)
+
+    # A delta query cannot see deletions, so compare against the full list of IDs
+    existing = episode_ids(db, backup_path)
+    for doc_id in [doc_id for doc_id in state['live'] if doc_id not in existing]:
+        owner, doc, _ = state['live'].pop(doc_id)
+        docs[owner][doc] = None
+        stats['deleted'] += 1
+
+    if mark is not None:
+        state['highWaterMark'] = mark.isoformat()
+    return table
+
+def build_search_index(backup_path=None, output_dir=DEFAULT_OUTPUT_DIR, publish="static", workers=DEFAULT_WORKERS,
+                       rebuild=False, merge=True, state_file=DEFAULT_STATE_FILE):
+    """Updates the transcript search index from Firestore or a backup and publishes it.
+
+    Episodes changed since the last run are written to a new segment, replaced or
+    deleted episodes are tombstoned, and full size tiers are merged afterwards. With
+    rebuild=True, or without a compatible existing index, everything is re-indexed.
+    """
+    print("Starting search index build...")
+    db = firestore_ops.client() if not backup_path or publish == "firestore" else None
+    store = FirestoreIndexStore(db, workers) if publish == "firestore" else StaticIndexStore(output_dir, state_file)
+
+    index = store.load_index()
+    state = store.load_state()
+    replaced = []
+    legacy = None
+    if (rebuild or index is None or index.get('version') != INDEX_VERSION or state is None
+            or state.get('indexCreatedAt') != index.get('createdAt')):
+        previous = index or {}
+        index = new_index()
+        state = new_state()
+        index['nextSegment'] = previous.get('nextSegment', 0)
+        # The old segments stay live until the new index is saved
+        replaced = [segment['id'] for segment in previous.get('segments', [])]
+        if previous.get('version') == 1:
+            legacy = previous
+    # Segments are never rewritten in place: numbering skips past anything a failed
+    # run left behind, and those leftovers are removed with the replaced segments
+    existing = store.list_segments()
+    index['nextSegment'] = max([index['nextSegment']] + [int(segment_id) + 1 for segment_id in existing])
+    replaced += sorted(existing - {segment['id'] for segment in index['segments']} - set(replaced))
+
+    stats = {'indexed': 0, 'unchanged': 0, 'deleted': 0}
+    table = index_changes(db, backup_path, index, state, stats)
+    if table.docs:
+        postings = table.postings()
+        segment = write_segment(store, index, postings, table.docs)
+        index['segments'].append(segment)
+        print(f"✓ Segment {segment['id']}: {len(table.docs)} episodes, {len(postings)} terms")
+    save_index(store, index, state)
+    print(f"✓ {stats['indexed']} episodes indexed, {stats['unchanged']} unchanged, {stats['deleted']} deleted")
+
+    if merge:
+        merge_segments(store, index, state)
+    if replaced:
+        store.remove_segments(replaced)
+    if legacy:
+        store.remove_legacy_shards(legacy)
+    print(f"✓ Published {len(index['segments'])} segments")
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or incrementally update the transcript search index.")
+    parser.add_argument("--backup", metavar="BACKUP_PATH",
+                        help="read episodes from a backup directory, shard file or manifest instead of Firestore")
+    parser.add_argument("--publish", choices=("static", "firestore"), default="static",
+                        help="write static JSON shards or searchIndex documents")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR,
+                        help="directory for static shards, served by the search page")
+    parser.add_argument("--state-file", default=DEFAULT_STATE_FILE,
+                        help="where the static builder keeps its state; keep it out of the published directory")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently when publishing to Firestore")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="re-index every episode into a fresh index instead of applying changes")
+    parser.add_argument("--no-merge", action="store_true",
+                        help="only add the new segment, leaving size-tiered merging to a later run")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    build_search_index(args.backup, args.output, args.publish, args.workers, args.rebuild, not args.no_merge,
+                       args.state_file)
@@ -0,0 +1,84 @@
+import re
+
+from source_cache import SourceCache
+
+DEFAULT_TOKEN_BUDGET = 100_000
+# Estimated cost of the heading and fences wrapped around every file, on top of its path
+SECTION_OVERHEAD_TOKENS = 10
+# Files are read this many at a time, so a small budget never reads the whole closure
+READ_WINDOW = 32
+
+# Words, numbers and single punctuation marks; long words cost about one token per 4 characters
+TOKEN_PIECE = re.compile(r"\w+|[^\w\s]")
+
+# Lines kept in a signature summary: imports, exports, declarations and method heads
+SIGNATURE_LINE = re.compile(
+    r"^\s*(?:import\b|export\b|(?:async\s+)?function\b|class\b|interface\b|type\s+\w+|enum\b|"
+    r"(?:const|let)\s+\w+\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>|"
+    r"(?:async\s+)?\w+\s*\([^)]*\)\s*(?::\s*[^={]+)?\{\s*$)"
+)
+
+def estimate_tokens(text):
+    """Estimate the token count of source text with a fast local heuristic."""
+    pieces = TOKEN_PIECE.findall(text)
+    return len(pieces) + sum((len(piece) - 1) // 4 for piece in pieces if len(piece) > 4)
+
+def summarize(text):
+    """Reduce a source file to its signatures: imports, exports, declarations and method heads."""
+    lines = [line.rstrip().rstrip("{").rstrip() for line in text.splitlines() if SIGNATURE_LINE.match(line)]
+    return "\n".join(lines)
+
+class Bundle:
+    """Files selected for a bundle, each as a (path, mode, text) section with mode "full" or "summary"."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.tokens = 0
+        self.sections = []
+        self.omitted = []
+
+    def fits(self, tokens):
+        return self.budget is None or self.tokens + tokens <= self.budget
+
+    def add(self, path, mode, text, tokens):
+        self.sections.append((path, mode, text))
+        self.tokens += tokens
+
+def build_bundle(paths, cache=None, budget=DEFAULT_TOKEN_BUDGET):
+    """Fill a token budget from paths, which are ranked most relevant first.
+
+    Each file goes in whole if it fits, else as a signature summary, else it is
+    omitted. Token counts and summaries are cached with the file contents, and
+    once the budget can't take another section the remaining files aren't read.
+    """
+    shared = cache is not None
+    cache = cache or SourceCache()
+    bundle = Bundle(budget)
+    paths = list(paths)
+    for start in range(0, len(paths), READ_WINDOW):
+        window = paths[start:start + READ_WINDOW]
+        if not bundle.fits(SECTION_OVERHEAD_TOKENS):
+            bundle.omitted.extend(window)
+            continue
+        contents = cache.read_many(window)
+        for path in window:
+            overhead = SECTION_OVERHEAD_TOKENS + estimate_tokens(path)
+            full_tokens = cache.derive(path, "tokens", estimate_tokens) + overhead
+            if bundle.fits(full_tokens):
+                bundle.add(path, "full", contents[path], full_tokens)
+                continue
+            summary = cache.derive(path, "summary", summarize)
+            summary_tokens = cache.derive(path, "summaryTokens", lambda content: estimate_tokens(summarize(content)))
+            summary_tokens += overhead
+            if summary and bundle.fits(summary_tokens):
+                bundle.add(path, "summary", summary, summary_tokens)
+            else:
+                bundle.omitted.append(path)
+    if not shared:
+        cache.save()
+    return bundle
+
+def rank_by_distance(graph, targets, max_depth=None):
+    """Order the import closure of targets by import distance, then path."""
+    distances = graph.distances(targets, max_depth)
+    return sorted(distances, key=lambda path: (distances[path], path))
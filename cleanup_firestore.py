@@ -1,18 +1,23 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import json
+import os
 import re
 from datetime import datetime
 
+import firestore_ops
+from firestore_batches import DEFAULT_WORKERS, write_in_batches
+
+# Number of actions whose source documents are fetched per get_all call
+SOURCE_WINDOW = 100
+# Firestore accepts at most 30 values in an 'in' filter
+MAX_IN_VALUES = 30
+
+# Runs of anything that's not alphanumeric collapse into a single underscore
+NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+
 def generate_correct_doc_id(title):
     """Generates the correct document ID by replacing all special characters with a single underscore."""
-    # Convert to lowercase
-    title = title.lower()
-    # Replace all special characters (anything that's not alphanumeric) with underscore
-    doc_id = re.sub(r'[^a-z0-9]', '_', title)
-    # Replace multiple underscores with a single underscore
-    doc_id = re.sub(r'_+', '_', doc_id)
-    # Remove leading/trailing underscores
-    return doc_id.strip('_')
+    return NON_ALPHANUMERIC.sub('_', title.lower()).strip('_')
 
 def get_timestamp_value(data):
     """Safely get a comparable timestamp value from document data."""
@@ -26,80 +31,260 @@ def get_timestamp_value(data):
             return datetime.min
     return datetime.min
 
-def cleanup_firestore():
-    """Cleans up duplicate documents in Firestore by merging them under the correct ID format."""
-    # Initialize Firebase Admin
-    try:
-        firebase_admin.get_app()
-    except ValueError:
-        cred = credentials.Certificate("serviceAccountKey.json")
-        firebase_admin.initialize_app(cred)
+def sort_key(data):
+    """Order documents by creation time, treating naive and aware timestamps alike."""
+    timestamp = get_timestamp_value(data)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.replace(tzinfo=None) - timestamp.utcoffset()
+    return timestamp
 
-    db = firestore.client()
-    collection_ref = db.collection('episodes')
-    
-    # Get all documents
-    print("Fetching all documents...")
-    docs = collection_ref.get()
-    
-    # Group documents by their correct ID
+def group_documents(collection_ref):
+    """Group episode IDs by their correct ID, reading only the title and createdAt fields."""
     doc_groups = {}
-    for doc in docs:
+    for doc in firestore_ops.stream(collection_ref.select(['title', 'createdAt'])):
         data = doc.to_dict()
-        correct_id = generate_correct_doc_id(data['title'])
-        if correct_id not in doc_groups:
-            doc_groups[correct_id] = []
-        doc_groups[correct_id].append((doc.id, data))
+        correct_id = generate_correct_doc_id(data.get('title', ''))
+        doc_groups.setdefault(correct_id, []).append((doc.id, data))
+    return doc_groups
+
+def build_plan(doc_groups):
+    """Turn document groups into a reviewable list of cleanup actions.
+
+    move:   a single document stored under an incorrect ID is copied to the correct ID
+    merge:  the oldest of several duplicates is copied to the correct ID, the rest deleted
+    delete: the correct ID already holds the oldest duplicate, the rest are deleted
+    """
+    actions = []
+    for correct_id, doc_list in sorted(doc_groups.items()):
+        if not correct_id:
+            continue
+        doc_list.sort(key=lambda doc: sort_key(doc[1]))
+        keep_id = doc_list[0][0]
+        deletes = [doc_id for doc_id, _ in doc_list if doc_id != correct_id]
+        if not deletes:
+            continue
+        if len(doc_list) == 1:
+            action_type = "move"
+        elif keep_id != correct_id:
+            action_type = "merge"
+        else:
+            action_type = "delete"
+        actions.append({
+            "id": len(actions),
+            "type": action_type,
+            "target": correct_id,
+            "source": keep_id if keep_id != correct_id else None,
+            "delete": deletes
+        })
+    return actions
+
+def plan_cleanup(plan_file=None):
+    """Analyzes the episodes collection and writes a dry-run cleanup plan."""
+    db = firestore_ops.client()
+    collection_ref = db.collection('episodes')
+
+    print("Fetching document titles...")
+    doc_groups = group_documents(collection_ref)
+    actions = build_plan(doc_groups)
 
     # Print analysis summary
     print("\n=== Analysis Summary ===")
     print(f"Total unique titles: {len(doc_groups)}")
-    duplicate_groups = sum(1 for docs in doc_groups.values() if len(docs) > 1)
-    print(f"Groups with duplicates: {duplicate_groups}")
-    incorrect_singles = sum(1 for docs in doc_groups.values() if len(docs) == 1 and docs[0][0] != generate_correct_doc_id(docs[0][1]['title']))
-    print(f"Single documents with incorrect IDs: {incorrect_singles}")
+    print(f"Groups with duplicates: {sum(1 for docs in doc_groups.values() if len(docs) > 1)}")
+    print(f"Single documents with incorrect IDs: {sum(1 for a in actions if a['type'] == 'move')}")
+    untitled = doc_groups.get('', [])
+    if untitled:
+        print(f"Documents without a usable title (left untouched): {[doc_id for doc_id, _ in untitled]}")
+
+    for action in actions:
+        source = f" from {action['source']}" if action['source'] else ""
+        print(f"  [{action['id']}] {action['type']} {action['target']}{source}, delete {action['delete']}")
+
+    plan_file = plan_file or f"cleanup_plan_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(plan_file, "w", encoding="utf-8") as f:
+        json.dump({"collection": "episodes", "createdAt": datetime.now().isoformat(), "actions": actions},
+                  f, ensure_ascii=False, indent=4)
+
+    print(f"\nPlan with {len(actions)} actions saved to {plan_file}")
+    print(f"Review it, then run: python cleanup_firestore.py --apply {plan_file}")
+    return plan_file
+
+def subcollection_operations(doc_ref, target_path=None):
+    """Move (or, without a target, delete) every subcollection document under an episode.
+
+    Deleting an episode does not delete its subcollections, e.g. transcriptChunks,
+    so they are handled explicitly.
+    """
+    operations = []
+    for subcollection in firestore_ops.list_collections(doc_ref):
+        for doc in firestore_ops.stream(subcollection):
+            if target_path:
+                operations.append(("set", f"{target_path}/{subcollection.id}/{doc.id}", doc.to_dict()))
+            operations.append(("delete", doc.reference.path, None))
+    return operations
+
+def stale_subcollection_operations(doc_ref, kept_paths):
+    """Delete the subcollection documents under a target that the moved episode does not bring along.
+
+    Only document keys are read.
+    """
+    operations = []
+    for subcollection in firestore_ops.list_collections(doc_ref):
+        for snapshot in firestore_ops.stream(subcollection.select([]), "keys"):
+            if snapshot.reference.path not in kept_paths:
+                operations.append(("delete", snapshot.reference.path, None))
+    return operations
+
+def action_operations(db, collection_ref, actions, stats, already_applied):
+    """Yield one atomic group of writes per action: the create plus all of its deletes.
+
+    An action whose source is gone but whose target exists was committed by an
+    earlier run that stopped before checkpointing it, and is passed to
+    already_applied instead.
+    """
+    collection = collection_ref.id
+    for start in range(0, len(actions), SOURCE_WINDOW):
+        window = actions[start:start + SOURCE_WINDOW]
+        # Full documents are only read for the episodes that actually move
+        source_refs = [collection_ref.document(action["source"]) for action in window if action["source"]]
+        sources = {snapshot.id: snapshot for snapshot in firestore_ops.get_all(db, source_refs)
+                   if snapshot.exists}
+        missing = [action for action in window if action["source"] and action["source"] not in sources]
+        target_refs = [collection_ref.document(action["target"]) for action in missing]
+        targets = {snapshot.id for snapshot in firestore_ops.get_all(db, target_refs, field_paths=[])
+                   if snapshot.exists}
+
+        for action in window:
+            group = []
+            target_path = f"{collection}/{action['target']}"
+            if action["source"]:
+                snapshot = sources.get(action["source"])
+                if snapshot is None and action["target"] in targets:
+                    already_applied(action["id"])
+                    continue
+                if snapshot is None:
+                    print(f"\nSkipping [{action['id']}]: {action['source']} no longer exists")
+                    stats['skipped'] += 1
+                    continue
+                group.append(("set", target_path, snapshot.to_dict()))
+                group += subcollection_operations(snapshot.reference, target_path)
+                # A merge replaces an existing target, whose chunks the new chunk index no longer lists
+                kept = {path for kind, path, _ in group if kind == "set"}
+                group += stale_subcollection_operations(collection_ref.document(action["target"]), kept)
+            for old_id in action["delete"]:
+                if old_id != action["source"]:
+                    group += subcollection_operations(collection_ref.document(old_id))
+                group.append(("delete", f"{collection}/{old_id}", None))
+            yield group
+
+def build_remap(actions):
+    """Map every removed episode ID to the ID its data now lives under."""
+    return {old_id: action["target"] for action in actions for old_id in action["delete"]}
+
+def reference_operations(db, remap, stats):
+    """Yield updates repointing fact checks from removed episode IDs to their new IDs.
+
+    Referencing fact checks are found through the episodeId index with one 'in'
+    query per group of old IDs, reading only the episodeId field.
+    """
+    old_ids = sorted(remap)
+    firestore = firestore_ops.sdk()
+    for start in range(0, len(old_ids), MAX_IN_VALUES):
+        query = (db.collection('factChecks')
+                 .where(filter=firestore.FieldFilter('episodeId', 'in', old_ids[start:start + MAX_IN_VALUES]))
+                 .select(['episodeId']))
+        for doc in firestore_ops.stream(query):
+            stats['references'] += 1
+            yield ("update", doc.reference.path, {
+                'episodeId': remap[doc.get('episodeId')],
+                'updatedAt': firestore.SERVER_TIMESTAMP
+            })
+
+def load_checkpoint(checkpoint_file):
+    """Return the IDs of actions already committed by an earlier run."""
+    if not os.path.exists(checkpoint_file):
+        return set()
+    with open(checkpoint_file, "r", encoding="utf-8") as f:
+        return {int(line) for line in f if line.strip()}
+
+def apply_plan(plan_file, workers=DEFAULT_WORKERS):
+    """Applies a cleanup plan written by plan_cleanup().
+
+    Every action commits atomically in a single batch, several batches are in flight
+    at once, and committed actions are appended to a checkpoint log so an interrupted
+    run can simply be started again. Fact checks referencing the removed episode IDs
+    are then repointed to the new ones. Returns the number of documents written or deleted.
+    """
+    db = firestore_ops.client()
+    with open(plan_file, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    collection_ref = db.collection(plan["collection"])
+
+    checkpoint_file = f"{plan_file}.checkpoint"
+    completed = load_checkpoint(checkpoint_file)
+    actions = [action for action in plan["actions"] if action["id"] not in completed]
 
     print("\n=== Starting Cleanup ===\n")
+    if completed:
+        print(f"Resuming: {len(completed)} actions already applied, {len(actions)} remaining")
+
+    # Each document is deleted by exactly one action, which identifies the committed actions
+    action_by_path = {
+        f"{plan['collection']}/{old_id}": action["id"] for action in actions for old_id in action["delete"]
+    }
+    stats = {'skipped': 0, 'applied': 0}
+    with open(checkpoint_file, "a", encoding="utf-8") as checkpoint:
+        def mark_applied(action_id):
+            if action_id not in completed:
+                completed.add(action_id)
+                checkpoint.write(f"{action_id}\n")
+                checkpoint.flush()
+                stats['applied'] += 1
+
+        def record(operations):
+            for kind, path, _ in operations:
+                action_id = action_by_path.pop(path, None) if kind == "delete" else None
+                if action_id is not None:
+                    mark_applied(action_id)
 
-    # Process each group
-    for correct_id, doc_list in doc_groups.items():
-        if len(doc_list) > 1:
-            print(f"\nProcessing duplicate group for: {correct_id}")
-            print(f"Found {len(doc_list)} duplicates with IDs: {[doc[0] for doc in doc_list]}")
-            
-            # Sort by createdAt timestamp
-            try:
-                doc_list.sort(key=lambda x: get_timestamp_value(x[1]))
-                oldest_id, keep_data = doc_list[0]
-                print(f"Keeping oldest document with ID: {oldest_id}")
-                
-                # If the oldest document doesn't have the correct ID format, create new document
-                if oldest_id != correct_id:
-                    print(f"Creating new document with correct ID: {correct_id}")
-                    collection_ref.document(correct_id).set(keep_data)
-                
-                # Delete all other documents (including the oldest if its ID was incorrect)
-                for old_id, _ in doc_list:
-                    if old_id != correct_id:
-                        print(f"Deleting document: {old_id}")
-                        collection_ref.document(old_id).delete()
-                        
-            except Exception as e:
-                print(f"Error processing group {correct_id}: {str(e)}")
-                continue
-                
-        elif len(doc_list) == 1:
-            # Handle single documents with incorrect IDs
-            old_id, data = doc_list[0]
-            if old_id != correct_id:
-                print(f"\nFixing single document ID from {old_id} to {correct_id}")
-                try:
-                    collection_ref.document(correct_id).set(data)
-                    collection_ref.document(old_id).delete()
-                except Exception as e:
-                    print(f"Error fixing {old_id}: {str(e)}")
+        operations = action_operations(db, collection_ref, actions, stats, mark_applied)
+        written, failed = write_in_batches(db, operations, workers, label="Applied", on_commit=record)
+
+    print(f"\n✓ {stats['applied']} actions applied ({written} writes), {stats['skipped']} skipped")
+    if failed:
+        print(f"✗ {failed} writes failed; re-run --apply {plan_file} to resume")
+
+    # Repoint references for every applied action, including those from earlier runs;
+    # already repointed fact checks no longer match, so this is safe to repeat
+    remap = build_remap([action for action in plan["actions"] if action["id"] in completed])
+    if remap:
+        stats['references'] = 0
+        repointed, failed = write_in_batches(db, reference_operations(db, remap, stats), workers, label="Repointed")
+        written += repointed
+        print(f"✓ {repointed} of {stats['references']} fact checks repointed to their new episode IDs")
+        if failed:
+            print(f"✗ {failed} fact checks could not be updated; re-run --apply {plan_file} to retry")
 
     print("\n=== Cleanup Complete ===")
+    return written
+
+def cleanup_firestore(workers=DEFAULT_WORKERS, plan_file=None):
+    """Plans the cleanup and applies it straight away, without a review in between."""
+    return apply_plan(plan_cleanup(plan_file), workers)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Merge duplicate episodes under their correct document IDs.")
+    parser.add_argument("--plan-file", help="where to write the dry-run plan")
+    parser.add_argument("--apply", metavar="PLAN_FILE", help="apply a previously reviewed plan")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently when applying")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    cleanup_firestore()
\ No newline at end of file
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    if args.apply:
+        apply_plan(args.apply, args.workers)
+    else:
+        plan_cleanup(args.plan_file)
@@ -1,38 +1,137 @@
-import os
-import pyperclip
-
-# List of files to copy
-files_to_copy = [
-    "src/lib/types/types.ts",
-    "src/lib/services/factCheckService.ts",
-    "src/lib/services/karmaService.ts",
-    "src/hooks/useModeration.ts",
-    "src/lib/types/validation.ts",
-    "src/lib/utils/constants.js"
-]
-
-
-# Base directory of your project
-base_dir = "C:/Users/timveigel/Documents/fridmanfacts/crowdcheck/"
-
-# Initialize clipboard content
-clipboard_content = ""
-
-for relative_path in files_to_copy:
-    file_path = os.path.join(base_dir, relative_path)
-    
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            file_content = file.read()
-            
-            # Add file name and content to clipboard content
-            clipboard_content += f"\n--- {relative_path} ---\n"
-            clipboard_content += file_content
-            clipboard_content += "\n--- EOF ---\n"
+#!/usr/bin/env python3
+"""
+Bundle source files into one prompt, for the clipboard, a file or stdout.
+
+    python fetch_files.py files "src/lib/services/*.ts" src/hooks/useModeration.ts
+    python fetch_files.py closure src/app/search/SearchResults.js --depth 2 -o bundle.md
+    python fetch_files.py project --include-tests -o -
+    python fetch_files.py tests src/lib/services/karmaService.ts
+
+"files" selects by glob, "closure" by the import graph of its targets; "project"
+and "tests" produce the promptgen.py and test_prompt.py prompts. Every mode reads
+through the same cached, memory-mapped SourceCache and fills the same token budget.
+"""
+
+import argparse
+import glob
+import sys
+
+from bundler import DEFAULT_TOKEN_BUDGET, build_bundle, rank_by_distance
+from import_graph import ImportGraph, normalize_path
+from source_cache import SourceCache
+
+def select_files(patterns):
+    """Expand globs ('**' included) in order, without duplicates; plain paths are kept even if missing."""
+    selected = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            path = normalize_path(path)
+            if path not in selected:
+                selected.append(path)
+    return selected
+
+def select_closure(targets, source_root="src", max_depth=None):
+    """Rank the import closure of targets by import distance, refreshing the persistent graph."""
+    graph = ImportGraph(source_root).refresh()
+    graph.save()
+    return rank_by_distance(graph, targets, max_depth)
+
+def iter_bundle(paths, cache, budget=DEFAULT_TOKEN_BUDGET):
+    """Yield the plain bundle: each file between '--- path ---' and '--- EOF ---' markers."""
+    bundle = build_bundle(paths, cache, budget)
+    for path, mode, content in bundle.sections:
+        label = f"{path} (signatures)" if mode == "summary" else path
+        yield f"\n--- {label} ---\n{content}\n--- EOF ---\n"
+    if bundle.omitted:
+        yield "\n--- Omitted to fit the token budget ---\n" + "".join(f"{path}\n" for path in bundle.omitted)
+
+def write_output(parts, output=None, clipboard=False):
+    """Stream parts to output ('-' for stdout) and/or collect them for the clipboard."""
+    copied = [] if clipboard else None
+    if output == "-":
+        out = sys.stdout
+    else:
+        out = open(output, "w", encoding="utf-8") if output else None
+    try:
+        for part in parts:
+            if out:
+                out.write(part)
+            if copied is not None:
+                copied.append(part)
+    finally:
+        if out and out is not sys.stdout:
+            out.close()
+    if copied is not None:
+        import pyperclip
+
+        pyperclip.copy("".join(copied))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bundle source files into one prompt.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--output", help="write the bundle to this file, or '-' for stdout")
+    common.add_argument("--clipboard", action="store_true",
+                        help="also copy the bundle to the clipboard (the default without --output)")
+    common.add_argument("--budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help=f"approximate token budget, 0 for no limit (default {DEFAULT_TOKEN_BUDGET})")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    files = subparsers.add_parser("files", parents=[common], help="bundle files matching globs")
+    files.add_argument("patterns", nargs="+", help="file paths or globs, e.g. 'src/lib/**/*.ts'")
+
+    closure = subparsers.add_parser("closure", parents=[common], help="bundle the import closure of targets")
+    closure.add_argument("targets", nargs="+", help="source files to start from")
+    closure.add_argument("--source-root", default="src", help="directory '@/' imports resolve to (default src)")
+    closure.add_argument("--depth", type=int, help="stop following imports this many levels away")
+
+    project = subparsers.add_parser("project", parents=[common], help="the promptgen.py project prompt")
+    project.add_argument("--root", default="src", help="directory to bundle (default src)")
+    project.add_argument("--include-tests", action="store_true", help="include __tests__ and __mocks__")
+
+    tests = subparsers.add_parser("tests", parents=[common], help="the test_prompt.py prompt for targets")
+    tests.add_argument("targets", nargs="+", help="source files to write tests for")
+    tests.add_argument("--depth", type=int, help="stop following imports this many levels away")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    budget = args.budget or None
+    cache = SourceCache()
+
+    if args.mode == "files":
+        parts = iter_bundle(select_files(args.patterns), cache, budget)
+    elif args.mode == "closure":
+        paths = select_closure(args.targets, args.source_root, args.depth)
+        if not paths:
+            print(f"ERROR: None of {args.targets} is a source file.")
+            sys.exit(1)
+        parts = iter_bundle(paths, cache, budget)
+    elif args.mode == "project":
+        import promptgen
+
+        parts = promptgen.iter_prompt(args.root, budget, cache, args.include_tests)
     else:
-        clipboard_content += f"\n--- {relative_path} ---\nFile not found.\n--- EOF ---\n"
+        # test_prompt.py loads directory_map.yml on import, so only this mode needs it
+        import test_prompt
+
+        graph = test_prompt.load_graph().refresh()
+        graph.save()
+        paths = rank_by_distance(graph, args.targets, args.depth)
+        if not paths:
+            print(f"ERROR: None of {args.targets} is a source file.")
+            sys.exit(1)
+        parts = test_prompt.iter_prompt(paths, cache, budget)
+
+    clipboard = args.clipboard or not args.output
+    write_output(parts, args.output, clipboard)
+    cache.save()
 
-# Copy all content to clipboard
-pyperclip.copy(clipboard_content)
+    destinations = [args.output if args.output != "-" else "stdout"] if args.output else []
+    if clipboard:
+        destinations.append("the clipboard")
+    # Report on stderr so a bundle streamed to stdout stays clean
+    print(f"Bundle written to {' and '.join(destinations)} ({cache.reads} files re-read).", file=sys.stderr)
 
-print("All specified files have been copied to the clipboard.")
+if __name__ == "__main__":
+    main()
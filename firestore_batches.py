@@ -0,0 +1,162 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import firestore_ops
+
+MAX_BATCH_OPS = 500
+# Commit requests are capped at 10 MiB; leave headroom for field names and overhead
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_RETRIES = 6
+# Firestore's "500/50/5" guidance: start at 500 ops/s, grow 50% every 5 minutes
+DEFAULT_WRITES_PER_SECOND = 500
+RAMP_INTERVAL = 300
+
+def retryable_errors():
+    """Errors raised on contention or overload that are safe to retry with backoff."""
+    from google.api_core import exceptions
+
+    return (
+        exceptions.Aborted,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.ResourceExhausted,
+        exceptions.ServiceUnavailable,
+    )
+
+def approximate_size(data):
+    """Estimate the encoded size of a document for batch sizing."""
+    return len(json.dumps(data, default=str, ensure_ascii=False).encode("utf-8"))
+
+def split_utf8(text, max_bytes):
+    """Split a string into slices of at most max_bytes once UTF-8 encoded, never inside a character."""
+    encoded = text.encode("utf-8")
+    slices = []
+    start = 0
+    while start < len(encoded):
+        end = min(start + max_bytes, len(encoded))
+        # Back up off continuation bytes so every slice decodes on its own
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        slices.append(encoded[start:end].decode("utf-8"))
+        start = end
+    return slices or [""]
+
+class WriteThrottle:
+    """Spaces out commits to a target write rate, optionally ramping it up over time."""
+
+    def __init__(self, writes_per_second, ramp=True):
+        self.writes_per_second = writes_per_second
+        self.ramp = ramp
+        self.started = time.monotonic()
+        self.next_slot = self.started
+        self.lock = threading.Lock()
+
+    def current_rate(self, now):
+        if not self.ramp:
+            return self.writes_per_second
+        return self.writes_per_second * 1.5 ** int((now - self.started) // RAMP_INTERVAL)
+
+    def acquire(self, count):
+        if not self.writes_per_second:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_slot)
+            self.next_slot = start + count / self.current_rate(now)
+        if start > now:
+            time.sleep(start - now)
+
+def iter_batches(operations, max_ops=MAX_BATCH_OPS, max_bytes=MAX_BATCH_BYTES):
+    """Group (kind, path, data) operations into batches within Firestore's commit limits.
+
+    An item may also be a list of operations, which is always kept within one batch
+    so it commits atomically.
+    """
+    batch = []
+    batch_bytes = 0
+    for item in operations:
+        group = item if isinstance(item, list) else [item]
+        size = sum(approximate_size(data) for _, _, data in group if data is not None)
+        if batch and (len(batch) + len(group) > max_ops or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.extend(group)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+def commit_batch(db, operations, throttle=None, max_retries=DEFAULT_MAX_RETRIES):
+    """Commit one batch of operations, retrying with jittered backoff on contention."""
+    from google.cloud.firestore_v1.field_path import FieldPath
+
+    deletes = sum(kind == "delete" for kind, _, _ in operations)
+    for attempt in range(max_retries + 1):
+        if throttle:
+            throttle.acquire(len(operations))
+        # A fresh batch per attempt, since a failed commit cannot be reused
+        batch = db.batch()
+        for kind, path, data in operations:
+            ref = db.document(path)
+            if kind == "set":
+                batch.set(ref, data)
+            elif kind == "merge":
+                # Replace exactly the given top-level fields, without deep-merging maps
+                batch.set(ref, data, merge=[FieldPath(key) for key in data])
+            elif kind == "update":
+                batch.update(ref, data)
+            elif kind == "delete":
+                batch.delete(ref)
+        try:
+            with firestore_ops.stats.timed("commit", writes=len(operations) - deletes, deletes=deletes):
+                batch.commit()
+            return len(operations)
+        except retryable_errors() as e:
+            if attempt == max_retries:
+                raise
+            delay = min(2 ** attempt, 30) * (0.5 + random.random())
+            print(f"\nRetrying batch in {delay:.1f}s after: {e}")
+            time.sleep(delay)
+
+def write_in_batches(db, operations, workers=DEFAULT_WORKERS, throttle=None, label="Wrote", on_commit=None):
+    """Commit operations as batches spread across a worker pool.
+
+    At most two batches per worker are in flight, so memory stays bounded while the
+    operations are read lazily. on_commit, if given, is called with the operations of
+    each successfully committed batch. Returns (written, failed) operation counts.
+    """
+    written = 0
+    failed = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+
+        def collect(done):
+            nonlocal written, failed
+            for future in done:
+                committed = pending.pop(future)
+                try:
+                    written += future.result()
+                except Exception as e:
+                    failed += len(committed)
+                    print(f"\n✗ Failed to commit batch of {len(committed)}: {e}")
+                    continue
+                if on_commit:
+                    on_commit(committed)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            print(f"\r{label} {written} documents ({written / elapsed:.0f} docs/s)", end="", flush=True)
+
+        for batch in iter_batches(operations):
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(commit_batch, db, batch, throttle)] = batch
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    print()
+    return written, failed
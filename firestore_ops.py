@@ -0,0 +1,195 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+SERVICE_ACCOUNT_FILE = "serviceAccountKey.json"
+# Project ID used against the emulator when there is no service account key
+EMULATOR_PROJECT_ID = "demo-fridmanfacts"
+# Upper bounds, in milliseconds, of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_client = None
+_client_lock = threading.Lock()
+_report_path = None
+_report_registered = False
+
+def sdk():
+    """Return the firebase_admin.firestore module, importing the SDK on first use.
+
+    The SDK takes a while to import, so scripts only pay for it once they actually
+    talk to Firestore; --help and local-only dry runs never load it.
+    """
+    from firebase_admin import firestore
+    return firestore
+
+def client():
+    """Return the Firestore client shared by every module of a run.
+
+    The Firebase app is initialized on first use from serviceAccountKey.json, or
+    without credentials against the emulator when FIRESTORE_EMULATOR_HOST is set and
+    there is no key. All callers reuse the one client and with it one gRPC channel.
+    The SDK already opens that channel with a 30 s keepalive and no message size
+    limits, so it is not configured again here.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            import firebase_admin
+            from firebase_admin import credentials
+
+            try:
+                firebase_admin.get_app()
+            except ValueError:
+                if os.environ.get("FIRESTORE_EMULATOR_HOST") and not os.path.exists(SERVICE_ACCOUNT_FILE):
+                    project_id = os.environ.get("GCLOUD_PROJECT", EMULATOR_PROJECT_ID)
+                    firebase_admin.initialize_app(options={"projectId": project_id})
+                else:
+                    firebase_admin.initialize_app(credentials.Certificate(SERVICE_ACCOUNT_FILE))
+            _client = sdk().client()
+            report_at_exit()
+    return _client
+
+class OpStats:
+    """Thread-safe counters of billed document operations plus per-call latency histograms."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.totals = {"reads": 0, "writes": 0, "deletes": 0, "errors": 0}
+        self.calls = {}
+
+    def record(self, call, seconds, reads=0, writes=0, deletes=0, error=False):
+        bucket = bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self.lock:
+            self.totals["reads"] += reads
+            self.totals["writes"] += writes
+            self.totals["deletes"] += deletes
+            self.totals["errors"] += error
+            stats = self.calls.get(call)
+            if stats is None:
+                stats = self.calls[call] = {
+                    "count": 0, "errors": 0, "seconds": 0.0, "maxSeconds": 0.0,
+                    "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                }
+            stats["count"] += 1
+            stats["errors"] += error
+            stats["seconds"] += seconds
+            stats["maxSeconds"] = max(stats["maxSeconds"], seconds)
+            stats["histogram"][bucket] += 1
+
+    @contextmanager
+    def timed(self, call, reads=0, writes=0, deletes=0):
+        """Record one call around a block; a block that raises is recorded as an error."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(call, time.perf_counter() - start, error=True)
+            raise
+        self.record(call, time.perf_counter() - start, reads, writes, deletes)
+
+    def percentile(self, call, fraction):
+        """Upper bound in milliseconds of the bucket holding the given fraction of a call's latencies."""
+        stats = self.calls[call]
+        target = fraction * stats["count"]
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + (None,), stats["histogram"]):
+            seen += count
+            if seen >= target:
+                return bound if bound is not None else stats["maxSeconds"] * 1000
+        return stats["maxSeconds"] * 1000
+
+    def summary(self):
+        with self.lock:
+            return {
+                "elapsedSeconds": round(time.monotonic() - self.started, 3),
+                **self.totals,
+                "bucketsMs": list(LATENCY_BUCKETS_MS),
+                "calls": json.loads(json.dumps(self.calls))
+            }
+
+    def report(self, file=sys.stderr):
+        """Print the totals and one latency line per call type."""
+        if not self.calls:
+            return
+        totals = self.totals
+        errors = f", {totals['errors']} failed calls" if totals["errors"] else ""
+        print(f"\nFirestore: {totals['reads']} reads, {totals['writes']} writes, {totals['deletes']} deletes{errors}",
+              file=file)
+        for call, stats in sorted(self.calls.items()):
+            mean_ms = stats["seconds"] / stats["count"] * 1000
+            print(f"  {call:<10} {stats['count']:>7} calls  mean {mean_ms:8.1f} ms  "
+                  f"p50 ≤{self.percentile(call, 0.5):>6.0f} ms  p99 ≤{self.percentile(call, 0.99):>6.0f} ms  "
+                  f"max {stats['maxSeconds'] * 1000:8.1f} ms", file=file)
+
+stats = OpStats()
+
+def report_at_exit(json_path=None):
+    """Print the operation summary when the process exits, and also dump it to json_path if given."""
+    global _report_path, _report_registered
+    if json_path:
+        _report_path = json_path
+    if not _report_registered:
+        atexit.register(_report)
+        _report_registered = True
+
+def _report():
+    stats.report()
+    if _report_path:
+        with open(_report_path, "w", encoding="utf-8") as f:
+            json.dump(stats.summary(), f, indent=2)
+
+def add_stats_argument(parser):
+    parser.add_argument("--stats", metavar="FILE",
+                        help="also write Firestore operation counts and latency histograms to FILE as JSON")
+
+def stream(query, call="stream"):
+    """Stream a query's documents, counting each as a read.
+
+    An empty result is still billed as one read. The recorded latency covers the
+    whole stream, including the time the caller spends between documents.
+    """
+    count = 0
+    failed = False
+    start = time.perf_counter()
+    try:
+        for snapshot in query.stream():
+            count += 1
+            yield snapshot
+    except Exception:
+        failed = True
+        raise
+    finally:
+        # Also reached when the caller stops early, which is not a failure
+        stats.record(call, time.perf_counter() - start, reads=max(count, 1), error=failed)
+
+def get(ref):
+    with stats.timed("get", reads=1):
+        return ref.get()
+
+def get_all(db, refs, field_paths=None):
+    """Fetch documents by reference in one call, counting a read per document."""
+    refs = list(refs)
+    if not refs:
+        return []
+    with stats.timed("getAll", reads=len(refs)):
+        return list(db.get_all(refs, field_paths=field_paths))
+
+def list_collections(parent):
+    """List the collections under a client or document reference, counted as one read."""
+    with stats.timed("collections", reads=1):
+        return list(parent.collections())
+
+def create_document(ref, data):
+    """Create a document, raising AlreadyExists if it is already there."""
+    with stats.timed("create", writes=1):
+        ref.create(data)
+
+def set_document(ref, data):
+    with stats.timed("set", writes=1):
+        ref.set(data)
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import firestore_ops
+from firestore_batches import DEFAULT_WORKERS, WriteThrottle, write_in_batches
+
+DEFAULT_CURSOR_FILE = "gc_cursor.json"
+DEFAULT_NOTIFICATION_DAYS = 90
+# Deletes are index writes too; keep the background job well below the 500/50/5 starting rate
+DEFAULT_DELETES_PER_SECOND = 200
+# Documents read per key-only page; each page's deletes are committed before the cursor moves on
+PAGE_SIZE = 1000
+PHASES = ("comments", "votes", "notifications")
+# Orphan paths printed per phase on a dry run
+MAX_EXAMPLES = 5
+
+def key_set(db, collection):
+    """Return the IDs of every document in a collection, with a key-only query."""
+    return {snapshot.id for snapshot in firestore_ops.stream(db.collection(collection).select([]), "keys")}
+
+def iter_pages(db, query, order=('__name__',), after=None, page_size=PAGE_SIZE):
+    """Yield pages of a query's snapshots, paging with cursors instead of holding one long stream open.
+
+    after resumes a query ordered by document path from the path a previous run
+    stopped at.
+    """
+    for field in order:
+        query = query.order_by(field)
+    cursor = {'__name__': db.document(after)} if after else None
+    while True:
+        page_query = query.limit(page_size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        page = list(firestore_ops.stream(page_query, "keys"))
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+def missing_documents(db, paths):
+    """Return which of the given document paths do not exist, reading no fields."""
+    refs = [db.document(path) for path in sorted(set(paths))]
+    return {snapshot.reference.path for snapshot in firestore_ops.get_all(db, refs, field_paths=[])
+            if not snapshot.exists}
+
+def orphaned(db, page, parent_of, removed=()):
+    """Return the paths in a page whose parent document is gone.
+
+    parent_of maps a snapshot to its parent's path, or None if it has no parent to
+    check or the parent is known to exist. Candidates are confirmed with a fresh read,
+    so a parent created after the live set was loaded keeps its children; parents in
+    removed count as gone without one.
+    """
+    candidates = {}
+    for snapshot in page:
+        parent = parent_of(snapshot)
+        if parent:
+            candidates[snapshot.reference.path] = parent
+    if not candidates:
+        return []
+    missing = missing_documents(db, set(candidates.values()) - set(removed)) | set(removed)
+    return [path for path, parent in candidates.items() if parent in missing]
+
+def comment_pages(db, after, removed):
+    """Yield (last path, orphans) per page of comments whose fact check no longer exists.
+
+    The orphans are also added to removed, for the votes phase.
+    """
+    live = key_set(db, 'factChecks')
+
+    def parent_of(snapshot):
+        fact_check_id = (snapshot.to_dict() or {}).get('factCheckId')
+        return f"factChecks/{fact_check_id}" if fact_check_id and fact_check_id not in live else None
+
+    for page in iter_pages(db, db.collection('comments').select(['factCheckId']), after=after):
+        orphans = orphaned(db, page, parent_of)
+        removed.update(orphans)
+        yield page[-1].reference.path, orphans
+
+def vote_pages(db, after, removed):
+    """Yield (last path, orphans) per page of factChecks and comments votes whose parent is gone.
+
+    One key-only scan of the votes collection group covers both parents.
+    """
+    live = {
+        'factChecks': key_set(db, 'factChecks'),
+        # On a dry run the orphaned comments still exist, but their votes would go with them
+        'comments': key_set(db, 'comments') - {path.split("/")[1] for path in removed},
+    }
+
+    def parent_of(snapshot):
+        collection, parent_id = snapshot.reference.path.split("/")[:2]
+        if collection not in live or parent_id in live[collection]:
+            return None
+        return f"{collection}/{parent_id}"
+
+    for page in iter_pages(db, db.collection_group('votes').select([]), after=after):
+        yield page[-1].reference.path, orphaned(db, page, parent_of, removed)
+
+def notification_pages(db, cutoff):
+    """Yield (last path, expired) per page of notifications created before cutoff.
+
+    Expired notifications disappear as they are deleted, so an interrupted run needs
+    no cursor to resume here.
+    """
+    query = (db.collection('notifications')
+             .where(filter=firestore_ops.sdk().FieldFilter('createdAt', '<', cutoff))
+             .select(['createdAt']))
+    for page in iter_pages(db, query, order=('createdAt', '__name__')):
+        yield page[-1].reference.path, [snapshot.reference.path for snapshot in page]
+
+def load_cursor(cursor_file):
+    """Return where an interrupted run stopped, or None to start from the first phase."""
+    if not os.path.exists(cursor_file):
+        return None
+    with open(cursor_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_cursor(cursor_file, cursor):
+    """Atomically replace the cursor file."""
+    tmp_path = f"{cursor_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cursor, f, indent=4)
+    os.replace(tmp_path, cursor_file)
+
+def collect_garbage(apply=False, notification_days=DEFAULT_NOTIFICATION_DAYS, cursor_file=DEFAULT_CURSOR_FILE,
+                    workers=DEFAULT_WORKERS, deletes_per_second=DEFAULT_DELETES_PER_SECOND):
+    """Deletes orphaned comments and votes and expired notifications; only counts them unless apply is set.
+
+    Orphans are found by set difference between key-only scans of the children and
+    the IDs of their live parents, one page at a time. Each page's deletes are
+    throttled and committed before the cursor file records the page as done, so an
+    interrupted run resumes where it stopped.
+    """
+    db = firestore_ops.client()
+    cursor = load_cursor(cursor_file) if apply else None
+    if cursor:
+        print(f"Resuming {cursor['phase']} after {cursor['after'] or 'the first page'}")
+    else:
+        cursor = {'phase': PHASES[0], 'after': None, 'deleted': {phase: 0 for phase in PHASES},
+                  'startedAt': datetime.now(timezone.utc).isoformat()}
+    throttle = WriteThrottle(deletes_per_second, ramp=False) if deletes_per_second else None
+    cutoff = datetime.now(timezone.utc) - timedelta(days=notification_days)
+    # Comments deleted, or found orphaned on a dry run, so far; their votes go too
+    removed = set()
+
+    print(f"\n=== {'Collecting' if apply else 'Dry run: counting'} garbage ===\n")
+    for phase in PHASES[PHASES.index(cursor['phase']):]:
+        after = cursor['after'] if phase == cursor['phase'] else None
+        if phase == "comments":
+            pages = comment_pages(db, after, removed)
+        elif phase == "votes":
+            pages = vote_pages(db, after, removed)
+        elif notification_days:
+            pages = notification_pages(db, cutoff)
+        else:
+            continue
+
+        examples = []
+        for last_path, paths in pages:
+            if not apply:
+                cursor['deleted'][phase] += len(paths)
+                examples += paths[:MAX_EXAMPLES - len(examples)]
+                continue
+            if paths:
+                written, failed = write_in_batches(db, [("delete", path, None) for path in paths], workers,
+                                                   throttle, f"Deleted {phase}")
+                cursor['deleted'][phase] += written
+                if failed:
+                    print(f"✗ {failed} deletes failed; re-run to resume from the last completed page")
+                    return cursor['deleted']
+            cursor.update(phase=phase, after=last_path)
+            save_cursor(cursor_file, cursor)
+
+        print(f"✓ {phase}: {cursor['deleted'][phase]} {'deleted' if apply else 'to delete'}")
+        for path in examples:
+            print(f"    {path}")
+        if apply:
+            next_phase = PHASES[PHASES.index(phase) + 1] if phase != PHASES[-1] else None
+            cursor.update(phase=next_phase, after=None)
+            if next_phase:
+                save_cursor(cursor_file, cursor)
+
+    if apply and os.path.exists(cursor_file):
+        os.remove(cursor_file)
+    print("\n=== Garbage collection complete ===" if apply else "\nRe-run with --apply to delete them")
+    return cursor['deleted']
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Delete votes and comments of deleted fact checks and expire old notifications."
+    )
+    parser.add_argument("--apply", action="store_true", help="delete the garbage instead of only counting it")
+    parser.add_argument("--notification-days", type=int, default=DEFAULT_NOTIFICATION_DAYS,
+                        help="delete notifications older than this many days (0 keeps them all)")
+    parser.add_argument("--cursor-file", default=DEFAULT_CURSOR_FILE,
+                        help="where an interrupted run records its progress, to resume from")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently")
+    parser.add_argument("--deletes-per-second", type=int, default=DEFAULT_DELETES_PER_SECOND,
+                        help="steady delete rate (0 disables throttling)")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    collect_garbage(args.apply, args.notification_days, args.cursor_file, args.workers, args.deletes_per_second)
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from firestore_batches import DEFAULT_WORKERS, write_in_batches
+from setup_firebase import generate_doc_id
+
+DEFAULT_SEED = 1
+# Everything is dated relative to this, so a seed always produces the same documents
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+STATUSES = ('UNVALIDATED', 'VALIDATED_TRUE', 'VALIDATED_FALSE', 'VALIDATED_CONTROVERSIAL')
+WORDS = (
+    "the of and to in is that it was for on are as with they be at one have this from or had by "
+    "but some what there we can out other were all your when up use word how said an each she "
+    "which do their time if will way about many then them would write like so these her long make "
+    "thing see him two has look more day could go come did number sound no most people my over know "
+    "water than call first who may down side been now find any new work part take get place made "
+    "live where after back little only round man year came show every good me give our under name "
+    "very through just form sentence great think say help low line differ turn cause much mean "
+    "before move right boy old too same tell does set three want air well also play small end put "
+    "home read hand port large spell add even land here must big high such follow act why ask men "
+    "change went light kind off need house picture try us again animal point mother world near "
+    "build self earth father consciousness intelligence evolution physics universe power history"
+).split()
+NAMES = (
+    "Ada Alan Grace Linus Marie Niels Rosalind Carl Emmy Richard Lise Claude Barbara Kurt Hedy "
+    "Edsger Donald Frances Tim Katherine Dennis Margaret John Sophie Werner Paul Erwin Chien"
+).split()
+
+# Mirrors KARMA_POINTS in src/lib/services/karmaService.ts, for the actions the generator records
+KARMA_POINTS = {
+    'SUBMIT_FACT': 15,
+    'FACT_VALIDATED_TRUE': 30,
+    'FACT_VALIDATED_FALSE': -15,
+    'FACT_VALIDATED_CONTROVERSIAL': 5,
+    'UNVALIDATED_FACT_UPVOTED': 1,
+    'UNVALIDATED_FACT_DOWNVOTED': -1,
+    'FACT_OWNER_UPVOTED': 3,
+    'FACT_OWNER_DOWNVOTED': -3,
+    'UPVOTE_GIVEN_VALIDATED_FALSE': -1,
+    'DOWNVOTE_GIVEN_VALIDATED_TRUE': -1,
+    'UPVOTE_GIVEN_VALIDATED_TRUE': 1,
+    'DOWNVOTE_GIVEN_VALIDATED_FALSE': 1,
+    'SUBMIT_COMMENT': 1,
+    'COMMENT_UPVOTED': 2,
+}
+
+DEFAULT_CONFIG = {
+    'episodes': 200,
+    # Transcript entries per episode, a few seconds of speech each
+    'transcriptEntries': 1500,
+    'users': 500,
+    'factChecksPerEpisode': 20,
+    'votesPerFactCheck': 8,
+    'commentsPerFactCheck': 3,
+    'votesPerComment': 2,
+    # Share of episodes that also exist under a second, older document ID
+    'duplicateFraction': 0.1,
+}
+
+def scaled_config(scale=1.0, **overrides):
+    """Return the default dataset configuration with every count multiplied by scale."""
+    config = dict(DEFAULT_CONFIG)
+    config['episodes'] = max(1, round(config['episodes'] * scale))
+    config['users'] = max(1, round(config['users'] * scale))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+def user_ids(config):
+    return [f"user{number:06d}" for number in range(config['users'])]
+
+def episode_items(config, seed=DEFAULT_SEED):
+    """Yield raw episode items in the ingestion format, with long timestamped transcripts."""
+    rng = random.Random(f"{seed}:episodes")
+    for number in range(config['episodes']):
+        guest = f"{rng.choice(NAMES)} {rng.choice(NAMES)}son"
+        seconds = 0
+        transcript = []
+        for _ in range(config['transcriptEntries']):
+            seconds += rng.randint(2, 12)
+            transcript.append({
+                'time': f"({seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d})",
+                'text': sentence(rng, rng.randint(6, 30))
+            })
+        yield {
+            'title': f"{guest}: {sentence(rng, 3)[:-1]} #{number + 1}",
+            'guest': guest,
+            'episodeNumber': number + 1,
+            'date': (EPOCH + timedelta(days=3 * number)).date().isoformat(),
+            'transcript': transcript
+        }
+
+def write_episodes(path, config, seed=DEFAULT_SEED):
+    """Write the episodes as a JSON Lines file for setup_firebase.py and return how many were written."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for item in episode_items(config, seed):
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def duplicate_operations(config, seed=DEFAULT_SEED):
+    """Yield older copies of some episodes under a second ID, for cleanup_firestore.py to merge."""
+    rng = random.Random(f"{seed}:duplicates")
+    for number, item in enumerate(episode_items(config, seed)):
+        if rng.random() >= config['duplicateFraction']:
+            continue
+        created = EPOCH + timedelta(days=3 * number)
+        yield ("set", f"episodes/{generate_doc_id(item['title'])}-legacy", {
+            'title': item['title'],
+            'guest': item['guest'],
+            'date': item['date'],
+            'createdAt': created,
+            'updatedAt': created
+        })
+
+def vote_actions(status, value):
+    """Return the karma actions for the fact check's owner and for the voter, as voteService.ts records them."""
+    direction = 'UP' if value > 0 else 'DOWN'
+    if status in ('VALIDATED_TRUE', 'VALIDATED_FALSE'):
+        voter_action = f"{direction}VOTE_GIVEN_{status}"
+    else:
+        voter_action = f"UNVALIDATED_FACT_{direction}VOTED"
+    return f"FACT_OWNER_{direction}VOTED", voter_action
+
+def social_operations(config, seed=DEFAULT_SEED):
+    """Yield factChecks with votes, comments with votes, karmaHistory and userKarma documents.
+
+    Karma history follows the app: entries carry the KARMA_POINTS value of their action
+    and are credited to the user the app credits, e.g. the author for a vote on their fact check.
+    """
+    rng = random.Random(f"{seed}:social")
+    users = user_ids(config)
+    karma = {}
+
+    def history(user_id, action, target_id, timestamp, actor=None):
+        # The actor keeps entries apart when one user is credited for many others' votes
+        points = KARMA_POINTS[action]
+        karma[user_id] = karma.get(user_id, 10) + points
+        return ("set", f"karmaHistory/{target_id}-{action.lower()}-{actor or user_id}", {
+            'userId': user_id, 'action': action, 'points': points,
+            'targetId': target_id, 'timestamp': timestamp
+        })
+
+    for episode_number, item in enumerate(episode_items(config, seed)):
+        episode_id = generate_doc_id(item['title'])
+        transcript = item['transcript']
+        for number in range(config['factChecksPerEpisode']):
+            fact_check_id = f"fc{episode_number:05d}{number:04d}"
+            author = rng.choice(users)
+            created = EPOCH + timedelta(days=3 * episode_number, minutes=rng.randint(0, 4000))
+            entry = rng.choice(transcript)
+            voters = rng.sample(users, min(config['votesPerFactCheck'], len(users)))
+            votes = [rng.choice((1, 1, 1, -1)) for _ in voters]
+            context = sentence(rng, rng.randint(10, 40))
+            status = rng.choice(STATUSES)
+            yield ("set", f"factChecks/{fact_check_id}", {
+                'episodeId': episode_id,
+                'transcriptTime': entry['time'],
+                'flaggedText': entry['text'][:80],
+                'submittedBy': author,
+                'source': f"https://example.org/{fact_check_id}",
+                'context': context,
+                'status': status,
+                'voteCount': sum(votes),
+                'upvotes': votes.count(1),
+                'downvotes': votes.count(-1),
+                'createdAt': created,
+                'updatedAt': created
+            })
+            yield history(author, 'SUBMIT_FACT', fact_check_id, created)
+            if status != 'UNVALIDATED':
+                yield history(author, f"FACT_{status}", fact_check_id, created + timedelta(days=1))
+            for voter, value in zip(voters, votes):
+                voted = created + timedelta(minutes=rng.randint(1, 600))
+                yield ("set", f"factChecks/{fact_check_id}/votes/{voter}",
+                       {'userId': voter, 'value': value, 'timestamp': voted})
+                # Votes on one's own fact check earn nothing
+                if voter == author:
+                    continue
+                owner_action, voter_action = vote_actions(status, value)
+                yield history(author, owner_action, fact_check_id, voted, actor=voter)
+                yield history(voter, voter_action, fact_check_id, voted)
+
+            for comment_number in range(config['commentsPerFactCheck']):
+                comment_id = f"{fact_check_id}c{comment_number:03d}"
+                commenter = rng.choice(users)
+                commented = created + timedelta(minutes=rng.randint(1, 900))
+                yield ("set", f"comments/{comment_id}", {
+                    'factCheckId': fact_check_id,
+                    'userId': commenter,
+                    'content': sentence(rng, rng.randint(5, 60)),
+                    'parentCommentId': None,
+                    'upvotes': config['votesPerComment'],
+                    'downvotes': 0,
+                    'createdAt': commented,
+                    'updatedAt': commented
+                })
+                yield history(commenter, 'SUBMIT_COMMENT', comment_id, commented)
+                for voter in rng.sample(users, min(config['votesPerComment'], len(users))):
+                    voted = commented + timedelta(minutes=5)
+                    yield ("set", f"comments/{comment_id}/votes/{voter}",
+                           {'userId': voter, 'value': 1, 'timestamp': voted})
+                    yield history(commenter, 'COMMENT_UPVOTED', comment_id, voted, actor=voter)
+
+    for user_id, total in sorted(karma.items()):
+        yield ("set", f"userKarma/{user_id}", {'userId': user_id, 'totalKarma': total, 'lastUpdated': EPOCH})
+
+def seed_firestore(db, config, seed=DEFAULT_SEED, workers=DEFAULT_WORKERS):
+    """Write the social collections and the duplicate episodes; returns the number of documents written."""
+    written, failed = write_in_batches(db, social_operations(config, seed), workers, label="Seeded")
+    duplicates, duplicate_failures = write_in_batches(db, duplicate_operations(config, seed), workers,
+                                                      label="Seeded duplicates")
+    if failed or duplicate_failures:
+        raise RuntimeError(f"{failed + duplicate_failures} seed documents failed to write")
+    return written + duplicates
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic dataset for benchmarks.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="random seed; a seed always yields the same data")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help=f"multiply the number of episodes ({DEFAULT_CONFIG['episodes']}) "
+                             f"and users ({DEFAULT_CONFIG['users']})")
+    parser.add_argument("--transcript-entries", type=int, help="transcript entries per episode")
+    parser.add_argument("--output", default="synthetic_episodes.jsonl",
+                        help="JSON Lines file of episodes for setup_firebase.py --input")
+    parser.add_argument("--emulator", metavar="HOST:PORT",
+                        help="also write factChecks, comments, votes, karma and duplicate episodes to the emulator")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently when seeding")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = scaled_config(args.scale, transcriptEntries=args.transcript_entries)
+    print(f"✓ Wrote {write_episodes(args.output, config, args.seed)} episodes to {args.output}")
+    if args.emulator:
+        import firestore_ops
+
+        # Seeding is only ever pointed at the emulator, never the live project
+        os.environ["FIRESTORE_EMULATOR_HOST"] = args.emulator
+        print(f"✓ Seeded {seed_firestore(firestore_ops.client(), config, args.seed, args.workers)} documents")
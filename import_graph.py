@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import re
+from collections import deque
+
+from source_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_GRAPH_FILE = os.path.join(DEFAULT_CACHE_DIR, "import_graph.json")
+DEFAULT_EXTENSIONS = (".js", ".ts", ".jsx", ".tsx")
+GRAPH_VERSION = 1
+
+# This pattern tries to capture file-based imports, e.g.:
+# import X from '../someFile'
+# import { Y } from '@/components/XYZ'
+# require('somePath');
+# It's naïve and may need refinement for more complex patterns.
+IMPORT_PATTERN = re.compile(
+    r"(?:import\s+(?:[\w*\s{},]+)\s+from\s+['\"]([^'\"]+)['\"]|require\(['\"]([^'\"]+)['\"]\))"
+)
+
+def is_local_file_import(path_str: str) -> bool:
+    """
+    Check if the import path is a relative or project-based local file path,
+    e.g. './', '../', or '@/'
+    as opposed to a library import like 'react', 'lodash', etc.
+    """
+    return path_str.startswith(("./", "../", "@/"))
+
+def normalize_path(path) -> str:
+    """Return a path relative to the working directory, with forward slashes."""
+    return os.path.relpath(os.path.abspath(path)).replace(os.sep, "/")
+
+def parse_imports(content: str) -> list:
+    """Return the local import specifiers of a source file, in order."""
+    specifiers = []
+    for match in IMPORT_PATTERN.findall(content):
+        # Only one of the two groups is non-empty
+        specifier = match[0] or match[1]
+        if is_local_file_import(specifier) and specifier not in specifiers:
+            specifiers.append(specifier)
+    return specifiers
+
+class ImportGraph:
+    """
+    Persistent graph of local imports between source files.
+
+    Each file's import specifiers are stored on disk keyed by mtime and size, with a
+    content hash so files that were only touched are not parsed again. Resolved
+    imports are stored too and only recomputed when files are added or removed,
+    since that is the only thing that changes how a specifier resolves.
+    """
+
+    def __init__(self, source_root="src", extensions=DEFAULT_EXTENSIONS, graph_file=DEFAULT_GRAPH_FILE,
+                 extra_roots=()):
+        self.source_root = normalize_path(source_root)
+        # Further trees to index, e.g. tests, so reverse queries can reach them
+        self.roots = [self.source_root] + [normalize_path(root) for root in extra_roots]
+        self.extensions = tuple(extensions)
+        self.graph_file = graph_file
+        self.files = {}
+        self.tree_hash = None
+        self.known = set()
+        self.reverse = {}
+        self.parsed = 0
+        self.dirty = False
+        self._resolved = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.graph_file):
+            return
+        try:
+            with open(self.graph_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            return
+        # A graph built with another configuration resolves differently, so start over
+        if (data.get("version") == GRAPH_VERSION and data.get("roots") == self.roots
+                and data.get("extensions") == list(self.extensions)):
+            self.files = data["files"]
+            self.tree_hash = data["treeHash"]
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.graph_file) or ".", exist_ok=True)
+        tmp_path = f"{self.graph_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": GRAPH_VERSION,
+                "roots": self.roots,
+                "extensions": list(self.extensions),
+                "treeHash": self.tree_hash,
+                "files": self.files
+            }, f, separators=(",", ":"))
+        os.replace(tmp_path, self.graph_file)
+        self.dirty = False
+
+    def refresh(self):
+        """Bring the graph up to date with the source trees, re-parsing only changed files.
+
+        Also rebuilds the reverse adjacency index used by dependents().
+        """
+        paths = []
+        for root in self.roots:
+            for dirpath, dirs, files in os.walk(root):
+                dirs.sort()
+                paths.extend(f"{dirpath}/{name}".replace(os.sep, "/") for name in sorted(files)
+                             if name.endswith(self.extensions))
+        self.known = set(paths)
+
+        tree_hash = hashlib.sha1("\n".join(paths).encode("utf-8")).hexdigest()
+        if tree_hash != self.tree_hash:
+            for entry in self.files.values():
+                entry["imports"] = None
+            self.tree_hash = tree_hash
+            self.dirty = True
+        for path in [path for path in self.files if self._in_roots(path) and path not in self.known]:
+            del self.files[path]
+            self.dirty = True
+        for path in paths:
+            self._entry(path)
+
+        self.reverse = {}
+        for path in paths:
+            for target in self.files[path]["imports"] if path in self.files else []:
+                self.reverse.setdefault(target, []).append(path)
+        return self
+
+    def _in_roots(self, path):
+        return any(path.startswith(f"{root}/") for root in self.roots)
+
+    def _entry(self, path):
+        """Return the up-to-date graph entry of one file, or None if it doesn't exist."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self.files.get(path)
+        if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            if entry["imports"] is None:
+                entry["imports"] = self._resolve_all(path, entry["specifiers"])
+            return entry
+
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except OSError as e:
+            print(f"Error reading {path}: {e}")
+            return None
+        digest = hashlib.sha1(raw).hexdigest()
+        if not entry or entry["hash"] != digest:
+            self.parsed += 1
+            specifiers = parse_imports(raw.decode("utf-8", errors="replace"))
+            entry = {"hash": digest, "specifiers": specifiers, "imports": None}
+        entry.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+        if entry["imports"] is None:
+            entry["imports"] = self._resolve_all(path, entry["specifiers"])
+        self.files[path] = entry
+        self.dirty = True
+        return entry
+
+    def _resolve_all(self, path, specifiers):
+        resolved = (self.resolve_import_path(path, specifier) for specifier in specifiers)
+        return [target for target in resolved if target]
+
+    def _exists(self, path):
+        # Files under the indexed roots are known from the walk; anything else is probed
+        if self.known and self._in_roots(path):
+            return path in self.known
+        return os.path.isfile(path)
+
+    def resolve_import_path(self, base_file, import_str):
+        """
+        Resolve an import string (e.g. '../utils/whatever') to a source file, trying
+        index files and extension fallbacks. '@/...' maps to the source root, Next.js
+        style. Results are memoized per importing directory; returns None if the
+        import doesn't resolve to a file.
+        """
+        base_dir = os.path.dirname(base_file)
+        key = (import_str, "" if import_str.startswith("@/") else base_dir)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        if import_str.startswith("@/"):
+            candidate = f"{self.source_root}/{import_str[2:]}"
+        else:
+            candidate = os.path.join(base_dir, import_str)
+        candidate = normalize_path(candidate)
+
+        resolved = None
+        if candidate.endswith(self.extensions) and self._exists(candidate):
+            resolved = candidate
+        else:
+            for option in [f"{candidate}/index{ext}" for ext in self.extensions] + \
+                          [f"{candidate}{ext}" for ext in self.extensions]:
+                if self._exists(option):
+                    resolved = option
+                    break
+        self._resolved[key] = resolved
+        return resolved
+
+    def dependencies(self, path):
+        entry = self._entry(normalize_path(path))
+        return entry["imports"] if entry else []
+
+    def distances(self, start_files, max_depth=None):
+        """
+        Map every file imported, directly or indirectly, by any of start_files to its
+        import distance from the nearest one, with a breadth-first traversal that
+        optionally stops max_depth imports away. Files come out nearest first.
+        """
+        depths = {}
+        for start_file in start_files:
+            start = normalize_path(start_file)
+            if start.endswith(self.extensions) and self._entry(start) is not None:
+                depths[start] = 0
+        queue = deque(depths)
+        while queue:
+            path = queue.popleft()
+            if max_depth is not None and depths[path] >= max_depth:
+                continue
+            for target in self.dependencies(path):
+                if target not in depths:
+                    depths[target] = depths[path] + 1
+                    queue.append(target)
+        return depths
+
+    def closure(self, start_file, max_depth=None):
+        """Gather all files imported, directly or indirectly, by start_file, nearest first."""
+        return list(self.distances([start_file], max_depth))
+
+    def dependents(self, target_file, max_depth=None):
+        """
+        Gather all indexed files that import target_file, directly or indirectly,
+        from the reverse adjacency index built by refresh().
+        """
+        start = normalize_path(target_file)
+        depths = {start: 0}
+        queue = deque([start])
+        while queue:
+            path = queue.popleft()
+            if max_depth is not None and depths[path] >= max_depth:
+                continue
+            for importer in self.reverse.get(path, []):
+                if importer not in depths:
+                    depths[importer] = depths[path] + 1
+                    queue.append(importer)
+        return list(depths)[1:]
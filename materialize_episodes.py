@@ -0,0 +1,327 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import firestore_ops
+from back_up_firestore import change_filter, change_time
+from cleanup_firestore import MAX_IN_VALUES
+from firestore_batches import DEFAULT_WORKERS, split_utf8, write_in_batches
+
+# Bump whenever the payload shape changes; readers ignore payloads of another version
+PAYLOAD_VERSION = 1
+DEFAULT_OUTPUT_DIR = os.path.join("public", "episode-payloads")
+PAYLOAD_COLLECTION = "episodePayloads"
+STATE_DOCUMENT = "_state"
+# Firestore documents are capped at 1 MiB, so larger payloads are stored in several parts
+MAX_PART_BYTES = 900 * 1024
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_millis(value):
+    """Serialize a timestamp the way serializeTimestamp does: milliseconds since the epoch, as a string."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return str((value - UNIX_EPOCH) // timedelta(milliseconds=1))
+
+def serialize_firebase_data(value):
+    """Mirror serializeFirebaseData in src/lib/utils/time.ts, turning timestamps into millisecond strings."""
+    if isinstance(value, datetime):
+        return to_millis(value)
+    if isinstance(value, dict):
+        return {key: serialize_firebase_data(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [serialize_firebase_data(item) for item in value]
+    return value
+
+def organize_fact_checks_by_time(fact_checks):
+    """Group fact checks by transcriptTime, as factCheckService.organizeFactChecksByTime does."""
+    organized = {}
+    for fact_check in fact_checks:
+        organized.setdefault(fact_check.get('transcriptTime'), []).append(fact_check)
+    return organized
+
+def episode_transcript(db, doc_id, data):
+    """Return an episode's transcript, assembling it from its transcriptChunks if it is sharded."""
+    if data.get('transcript') is not None:
+        return data['transcript']
+    chunks = data.get('transcriptChunks') or []
+    if not chunks:
+        return []
+    chunks_ref = db.collection('episodes').document(doc_id).collection('transcriptChunks')
+    snapshots = {snapshot.id: snapshot for snapshot in
+                 firestore_ops.get_all(db, [chunks_ref.document(chunk['id']) for chunk in chunks])}
+    # get_all returns documents in any order; the chunk index has them in transcript order
+    return [entry for chunk in chunks if snapshots[chunk['id']].exists
+            for entry in snapshots[chunk['id']].to_dict().get('entries', [])]
+
+def fact_checks_for_episodes(db, episode_ids):
+    """Return {episodeId: [fact check]} with one 'in' query for the whole group of episodes."""
+    query = (db.collection('factChecks')
+             .where(filter=firestore_ops.sdk().FieldFilter('episodeId', 'in', list(episode_ids))))
+    fact_checks = {episode_id: [] for episode_id in episode_ids}
+    for doc in firestore_ops.stream(query):
+        data = doc.to_dict()
+        fact_checks[data['episodeId']].append({'id': doc.id, **data})
+    # Match the document ID order of the per-episode query the page used to run
+    for items in fact_checks.values():
+        items.sort(key=lambda item: item['id'])
+    return fact_checks
+
+def render_payload(doc_id, data, transcript, fact_checks):
+    """Build what episodeService.getEpisodeById returns for an episode."""
+    return serialize_firebase_data({
+        'id': doc_id,
+        'thumbnail': data.get('thumbnail') or '',
+        'title': data.get('title') or '',
+        'guest': data.get('guest') or '',
+        'date': data.get('date') or '',
+        'video_link': data.get('video_link') or '',
+        'timestamps': data.get('timestamps') or [],
+        'transcript': transcript,
+        'factChecks': organize_fact_checks_by_time(fact_checks)
+    })
+
+def render_group(db, episode_ids):
+    """Render a group of at most MAX_IN_VALUES episodes; returns [(id, snapshot)], None for deleted ones."""
+    refs = [db.collection('episodes').document(doc_id) for doc_id in episode_ids]
+    episodes = {snapshot.id: snapshot for snapshot in firestore_ops.get_all(db, refs)}
+    live = [doc_id for doc_id in episode_ids if doc_id in episodes and episodes[doc_id].exists]
+    fact_checks = fact_checks_for_episodes(db, live) if live else {}
+    rendered = []
+    for doc_id in episode_ids:
+        if doc_id not in fact_checks:
+            rendered.append((doc_id, None))
+            continue
+        data = episodes[doc_id].to_dict()
+        payload = render_payload(doc_id, data, episode_transcript(db, doc_id, data), fact_checks[doc_id])
+        updated = change_time(data.get('updatedAt'))
+        rendered.append((doc_id, {
+            'version': PAYLOAD_VERSION,
+            'episodeUpdatedAt': to_millis(updated) if updated else None,
+            'builtAt': datetime.now(timezone.utc).isoformat(),
+            'episode': payload
+        }))
+    return rendered
+
+def payload_hash(snapshot):
+    """Fingerprint a snapshot's content, ignoring when it was built."""
+    content = json.dumps([snapshot['episodeUpdatedAt'], snapshot['episode']], ensure_ascii=False,
+                         sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+def changed_episode_ids(db, since):
+    """Return the IDs of episodes whose document or fact checks changed after since, and the newest change seen."""
+    mark = change_time(since)
+    changed = set()
+    episodes = change_filter(db.collection('episodes'), 'updatedAt', since).select(['updatedAt'])
+    fact_checks = change_filter(db.collection('factChecks'), 'updatedAt', since).select(['episodeId', 'updatedAt'])
+    for query, id_of in ((episodes, lambda doc: doc.id), (fact_checks, lambda doc: doc.get('episodeId'))):
+        for doc in firestore_ops.stream(query, "delta"):
+            if id_of(doc):
+                changed.add(id_of(doc))
+            updated = change_time(doc.get('updatedAt'))
+            if updated is not None and (mark is None or updated > mark):
+                mark = updated
+    return changed, mark
+
+def episode_ids(db):
+    return {snapshot.id for snapshot in firestore_ops.stream(db.collection('episodes').select([]), "keys")}
+
+class StaticPayloadStore:
+    """Keeps payloads as files, <id>.json, next to the job state in _state.json."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.state_path = os.path.join(output_dir, f"{STATE_DOCUMENT}.json")
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(f"{self.state_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+    def write(self, snapshots, previous):
+        """Write (id, snapshot, data) triples and return {id: part count}."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        parts = {}
+        for doc_id, _, data in snapshots:
+            path = os.path.join(self.output_dir, f"{doc_id}.json")
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+            parts[doc_id] = 1
+        return parts
+
+    def remove(self, removed):
+        for doc_id in removed:
+            try:
+                os.remove(os.path.join(self.output_dir, f"{doc_id}.json"))
+            except FileNotFoundError:
+                pass
+
+class FirestorePayloadStore:
+    """Keeps payloads in the episodePayloads collection.
+
+    episodePayloads/<id> holds the version, the episode's updatedAt and the first
+    slice of the payload JSON; payloads over MAX_PART_BYTES continue in
+    episodePayloads/<id>/parts/<n>. The payload is stored as a JSON string, so a
+    long transcript does not become thousands of indexed fields.
+    """
+
+    def __init__(self, db, workers=DEFAULT_WORKERS):
+        self.db = db
+        self.workers = workers
+        self.collection = db.collection(PAYLOAD_COLLECTION)
+
+    def load_state(self):
+        snapshot = firestore_ops.get(self.collection.document(STATE_DOCUMENT))
+        return json.loads(snapshot.get('data')) if snapshot.exists else None
+
+    def save_state(self, state):
+        firestore_ops.set_document(self.collection.document(STATE_DOCUMENT),
+                                   {'data': json.dumps(state, separators=(",", ":"))})
+
+    def operations(self, snapshots, previous, parts):
+        for doc_id, snapshot, data in snapshots:
+            slices = split_utf8(data, MAX_PART_BYTES)
+            parts[doc_id] = len(slices)
+            # The main document and its parts are committed together, so readers never mix versions
+            group = [("set", f"{PAYLOAD_COLLECTION}/{doc_id}", {
+                'version': snapshot['version'],
+                'episodeUpdatedAt': snapshot['episodeUpdatedAt'],
+                'builtAt': snapshot['builtAt'],
+                'parts': len(slices),
+                'data': slices[0]
+            })]
+            group += [("set", f"{PAYLOAD_COLLECTION}/{doc_id}/parts/{part}", {'data': slices[part]})
+                      for part in range(1, len(slices))]
+            group += [("delete", f"{PAYLOAD_COLLECTION}/{doc_id}/parts/{part}", None)
+                      for part in range(len(slices), previous.get(doc_id, 1))]
+            yield group
+
+    def write(self, snapshots, previous):
+        parts = {}
+        written, failed = write_in_batches(self.db, self.operations(snapshots, previous, parts), self.workers,
+                                           label="Published")
+        if failed:
+            raise RuntimeError(f"{failed} payload documents failed to write")
+        return parts
+
+    def remove(self, removed):
+        operations = []
+        for doc_id, part_count in removed.items():
+            operations += [("delete", f"{PAYLOAD_COLLECTION}/{doc_id}/parts/{part}", None)
+                           for part in range(1, part_count)]
+            operations.append(("delete", f"{PAYLOAD_COLLECTION}/{doc_id}", None))
+        write_in_batches(self.db, operations, self.workers, label="Removed")
+
+def new_state():
+    return {
+        'version': PAYLOAD_VERSION,
+        # Episode ID -> [episodeUpdatedAt, payload hash, part count]
+        'episodes': {},
+        'highWaterMark': None
+    }
+
+def render_changed(db, changed, workers, stats):
+    """Yield (id, snapshot) for the changed episodes, rendering groups of them on a worker pool.
+
+    At most two groups per worker are rendered ahead of the writer, so memory stays
+    bounded however many episodes changed.
+    """
+    ids = sorted(changed)
+    groups = [ids[start:start + MAX_IN_VALUES] for start in range(0, len(ids), MAX_IN_VALUES)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = [executor.submit(render_group, db, group) for group in groups[:workers * 2]]
+        next_group = len(pending)
+        while pending:
+            rendered = pending.pop(0).result()
+            if next_group < len(groups):
+                pending.append(executor.submit(render_group, db, groups[next_group]))
+                next_group += 1
+            for doc_id, snapshot in rendered:
+                stats['rendered'] += snapshot is not None
+                yield doc_id, snapshot
+
+def materialize_episodes(publish="firestore", output_dir=DEFAULT_OUTPUT_DIR, workers=DEFAULT_WORKERS,
+                         rebuild=False):
+    """Precomputes the episode page payloads whose episode or fact checks changed since the last run.
+
+    Each payload is exactly what episodeService.getEpisodeById would assemble: the
+    episode fields, its full transcript and its fact checks grouped by transcript
+    time, serialized. Payloads whose content did not change are not rewritten, and
+    payloads of deleted episodes are removed.
+    """
+    print("Starting episode payload build...")
+    db = firestore_ops.client()
+    store = FirestorePayloadStore(db, workers) if publish == "firestore" else StaticPayloadStore(output_dir)
+
+    state = store.load_state()
+    if rebuild or state is None or state.get('version') != PAYLOAD_VERSION:
+        state = new_state()
+    stats = {'rendered': 0, 'unchanged': 0, 'deleted': 0}
+
+    changed, mark = changed_episode_ids(db, state['highWaterMark'])
+    # A delta query cannot see deletions, so compare against the full list of IDs
+    existing = episode_ids(db)
+    if not state['highWaterMark']:
+        changed |= existing
+    removed = {doc_id: state['episodes'][doc_id][2] for doc_id in state['episodes'] if doc_id not in existing}
+    print(f"{len(changed)} episodes changed since {state['highWaterMark'] or 'the beginning'}")
+
+    def snapshots():
+        for doc_id, snapshot in render_changed(db, changed, workers, stats):
+            if snapshot is None:
+                if doc_id in state['episodes']:
+                    removed[doc_id] = state['episodes'][doc_id][2]
+                continue
+            content_hash = payload_hash(snapshot)
+            current = state['episodes'].get(doc_id)
+            if current and current[:2] == [snapshot['episodeUpdatedAt'], content_hash]:
+                stats['unchanged'] += 1
+                continue
+            state['episodes'][doc_id] = [snapshot['episodeUpdatedAt'], content_hash,
+                                         current[2] if current else 1]
+            yield doc_id, snapshot, json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    previous = {doc_id: entry[2] for doc_id, entry in state['episodes'].items()}
+    for doc_id, part_count in store.write(snapshots(), previous).items():
+        state['episodes'][doc_id][2] = part_count
+    if removed:
+        store.remove(removed)
+        for doc_id in removed:
+            state['episodes'].pop(doc_id, None)
+        stats['deleted'] = len(removed)
+
+    if mark is not None:
+        state['highWaterMark'] = mark.isoformat()
+    state['builtAt'] = datetime.now(timezone.utc).isoformat()
+    store.save_state(state)
+    print(f"✓ {stats['rendered'] - stats['unchanged']} payloads written, {stats['unchanged']} unchanged, "
+          f"{stats['deleted']} removed")
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute episode page payloads for changed episodes.")
+    parser.add_argument("--publish", choices=("firestore", "static"), default="firestore",
+                        help="write episodePayloads documents, read by the episode page, or static JSON files")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="directory for static payload files")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of episode groups rendered and batches committed concurrently")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="re-render every episode instead of only those changed since the last run")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    materialize_episodes(args.publish, args.output, args.workers, args.rebuild)
@@ -1,7 +1,8 @@
 import os
 import sys
-import subprocess
-import pyperclip
+
+from bundler import DEFAULT_TOKEN_BUDGET, build_bundle, estimate_tokens
+from source_cache import SourceCache
 
 # Check if the user wants to include test files
 include_tests = "--include-tests" in sys.argv
@@ -87,36 +88,80 @@ I'm using Next.js with app router, and my project has a standard src-level organ
 I provided you with the most relevant files of the current implementation. Here is my file structure from the src dir:
 """
 
-# Get directory structure using `tree` command
-result = subprocess.run("cmd.exe /c tree /F src", stdout=subprocess.PIPE, text=True, shell=True)
-directory_structure = result.stdout
-
-file_contents = "\n\n*All file implementations in the directory*\n\n"
+EXCLUDED_EXTENSIONS = (".woff", ".ico", ".png", ".jpg", ".jpeg", ".gif")
+TEST_DIRS = ("__tests__", "__mocks__")
 
 def is_text_file(filename):
-    excluded_extensions = (".woff", ".ico", ".png", ".jpg", ".jpeg", ".gif")
-    return not filename.lower().endswith(excluded_extensions)
-
-for root, dirs, files in os.walk("src"):
-    # If not including tests, remove any __tests__ directories from traversal
-    if not include_tests:
-        dirs[:] = [d for d in dirs if d != "__tests__"]
-
-        # and skip __mocks__ directories
-        dirs[:] = [d for d in dirs if d != "__mocks__"]
-
-    for file in files:
-        filepath = os.path.join(root, file)
-        if is_text_file(file):
-            try:
-                with open(filepath, "r", encoding="utf-8", errors="replace") as f:
-                    content = f.read()
-                file_contents += f"\n---\nFile: {filepath}\n---\n{content}\n"
-            except Exception as e:
-                file_contents += f"\n---\nFile: {filepath}\n---\n[Error reading file: {e}]\n"
-        else:
-            file_contents += f"\n---\nFile: {filepath}\n---\n[Skipped binary or non-text file]\n"
-
-full_prompt = overview + "\n" + directory_structure + file_contents
-pyperclip.copy(full_prompt)
-print("Full prompt has been copied to the clipboard.")
+    return not filename.lower().endswith(EXCLUDED_EXTENSIONS)
+
+def skipped_dirs(tests=None):
+    # If not including tests, skip __tests__ and __mocks__ directories
+    return () if (include_tests if tests is None else tests) else TEST_DIRS
+
+def render_tree(root, tests=None):
+    """Render the directory structure like `tree`, without shelling out."""
+    lines = [root]
+    skipped = skipped_dirs(tests)
+
+    def walk(directory, indent):
+        entries = sorted(os.scandir(directory), key=lambda entry: (not entry.is_dir(), entry.name.lower()))
+        entries = [entry for entry in entries if not (entry.is_dir() and entry.name in skipped)]
+        for i, entry in enumerate(entries):
+            last = i == len(entries) - 1
+            lines.append(f"{indent}{'└── ' if last else '├── '}{entry.name}")
+            if entry.is_dir():
+                walk(entry.path, indent + ("    " if last else "│   "))
+
+    walk(root, "")
+    return "\n".join(lines) + "\n"
+
+def list_files(root, tests=None):
+    paths = []
+    skipped = skipped_dirs(tests)
+    for dirpath, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in skipped)
+        paths.extend(os.path.join(dirpath, file) for file in sorted(files))
+    return paths
+
+def iter_prompt(root="src", budget=DEFAULT_TOKEN_BUDGET, cache=None, tests=None):
+    """Yield the prompt in parts, reading only files changed since the last run.
+
+    Files past the token budget are reduced to their signatures, then left out.
+    """
+    paths = list_files(root, tests)
+    header = [overview, "\n", render_tree(root, tests), "\n\n*All file implementations in the directory*\n\n"]
+    if budget is not None:
+        budget = max(budget - estimate_tokens("".join(header)), 0)
+    yield from header
+    shared = cache is not None
+    cache = cache or SourceCache()
+    bundle = build_bundle([path for path in paths if is_text_file(path)], cache, budget)
+    if not shared:
+        cache.save()
+
+    sections = {path: (mode, content) for path, mode, content in bundle.sections}
+    for filepath in paths:
+        if not is_text_file(filepath):
+            yield f"\n---\nFile: {filepath}\n---\n[Skipped binary or non-text file]\n"
+        elif filepath in sections:
+            mode, content = sections[filepath]
+            label = "Signatures" if mode == "summary" else "File"
+            yield f"\n---\n{label}: {filepath}\n---\n{content}\n"
+    if bundle.omitted:
+        yield "\n---\nOmitted to fit the token budget:\n" + "".join(f"{path}\n" for path in bundle.omitted)
+
+def build_prompt(root="src", budget=DEFAULT_TOKEN_BUDGET):
+    """Assemble the prompt from parts joined once; returns it with the number of files re-read."""
+    cache = SourceCache()
+    prompt = "".join(iter_prompt(root, budget, cache))
+    cache.save()
+    return prompt, cache.reads
+
+if __name__ == "__main__":
+    import pyperclip
+
+    # Approximate token budget for the whole prompt, e.g. --budget 50000; 0 means no limit
+    budget = int(sys.argv[sys.argv.index("--budget") + 1]) if "--budget" in sys.argv else DEFAULT_TOKEN_BUDGET
+    full_prompt, reads = build_prompt(budget=budget or None)
+    pyperclip.copy(full_prompt)
+    print(f"Full prompt has been copied to the clipboard ({reads} files re-read).")
@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+from array import array
+
+import numpy as np
+
+import firestore_ops
+from back_up_firestore import iter_collection_records
+from firestore_batches import DEFAULT_WORKERS, write_in_batches
+
+# Every user starts with this much karma before any history entry (see karmaService.ts)
+STARTING_KARMA = 10
+
+class KarmaHistoryTable:
+    """Columnar, in-memory table of karmaHistory entries.
+
+    User IDs and actions are factorized into integer codes while streaming, so
+    re-pricing and per-user totals are NumPy passes over flat arrays.
+    """
+
+    def __init__(self):
+        self.user_codes = {}
+        self.action_codes = {}
+        self.user = array('i')
+        self.action = array('i')
+        self.points = array('q')
+        self.ids = []
+
+    def append(self, entry_id, user_id, action, points):
+        self.user.append(self.user_codes.setdefault(user_id, len(self.user_codes)))
+        self.action.append(self.action_codes.setdefault(action, len(self.action_codes)))
+        self.points.append(int(points or 0))
+        self.ids.append(entry_id)
+
+    def repriced(self, point_table):
+        """Return the points of every entry under a new point table.
+
+        Actions missing from the table keep the points recorded on the entry.
+        """
+        points = np.frombuffer(self.points, dtype=np.int64)
+        if not point_table:
+            return points
+        defined = np.zeros(len(self.action_codes), dtype=bool)
+        values = np.zeros(len(self.action_codes), dtype=np.int64)
+        for action, code in self.action_codes.items():
+            if action in point_table:
+                defined[code] = True
+                values[code] = point_table[action]
+        actions = np.frombuffer(self.action, dtype=np.int32)
+        return np.where(defined[actions], values[actions], points)
+
+    def totals(self, points):
+        """Sum points per user in one group-by pass, on top of the starting karma."""
+        users = np.frombuffer(self.user, dtype=np.int32)
+        sums = np.bincount(users, weights=points, minlength=len(self.user_codes))
+        return {user_id: STARTING_KARMA + int(round(sums[code])) for user_id, code in self.user_codes.items()}
+
+def load_point_table(path):
+    """Load a {"ACTION": points} JSON file, e.g. an updated copy of KARMA_POINTS."""
+    with open(path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    if not all(isinstance(points, int) for points in table.values()):
+        raise ValueError(f"Point values in {path} must be integers")
+    return table
+
+def history_documents(db, backup_path):
+    """Yield (id, data) for karmaHistory entries from Firestore or a backup, projected to the needed fields."""
+    if backup_path:
+        for record in iter_collection_records(backup_path, 'karmaHistory'):
+            yield record['id'], record['data']
+    else:
+        for doc in firestore_ops.stream(db.collection('karmaHistory').select(['userId', 'action', 'points'])):
+            yield doc.id, doc.to_dict()
+
+def stored_totals(db, backup_path):
+    """Yield (userId, totalKarma) for every userKarma document in Firestore or a backup."""
+    if backup_path:
+        for record in iter_collection_records(backup_path, 'userKarma'):
+            yield record['id'], record['data'].get('totalKarma')
+    else:
+        for doc in firestore_ops.stream(db.collection('userKarma').select(['totalKarma'])):
+            yield doc.id, doc.to_dict().get('totalKarma')
+
+def load_history(db, backup_path):
+    """Stream karmaHistory into a KarmaHistoryTable."""
+    table = KarmaHistoryTable()
+    for entry_id, data in history_documents(db, backup_path):
+        if data.get('userId'):
+            table.append(entry_id, data['userId'], data.get('action'), data.get('points'))
+    return table
+
+def history_corrections(table, points):
+    """Yield updates for history entries whose recorded points differ from the new table."""
+    recorded = np.frombuffer(table.points, dtype=np.int64)
+    for index in np.flatnonzero(points != recorded):
+        yield ("update", f"karmaHistory/{table.ids[index]}", {'points': int(points[index])})
+
+def karma_corrections(expected, stored, stats):
+    """Yield writes for users whose stored totalKarma differs from the recomputed one."""
+    firestore = firestore_ops.sdk()
+    for user_id, total in stored:
+        expected_total = expected.pop(user_id, STARTING_KARMA)
+        if total == expected_total:
+            stats['unchanged'] += 1
+            continue
+        stats['corrected'] += 1
+        stats['drift'] += abs(expected_total - (total or 0))
+        yield ("update", f"userKarma/{user_id}", {
+            'totalKarma': expected_total,
+            'lastUpdated': firestore.SERVER_TIMESTAMP
+        })
+    # Users with history but no karma document yet
+    for user_id, expected_total in expected.items():
+        stats['created'] += 1
+        yield ("set", f"userKarma/{user_id}", {
+            'userId': user_id,
+            'totalKarma': expected_total,
+            'lastUpdated': firestore.SERVER_TIMESTAMP
+        })
+
+def recompute_karma(points_file=None, backup_path=None, workers=DEFAULT_WORKERS, dry_run=False):
+    """Rebuilds every user's totalKarma from karmaHistory and writes the corrections.
+
+    With points_file, history entries are re-priced with the new point table first
+    and their stored points are rewritten along with the totals. With backup_path,
+    history and stored totals are read from a backup instead of Firestore.
+    """
+    print("Starting karma recompute...")
+    db = firestore_ops.client() if not (backup_path and dry_run) else None
+    point_table = load_point_table(points_file) if points_file else None
+
+    table = load_history(db, backup_path)
+    print(f"✓ Loaded {len(table.ids)} history entries for {len(table.user_codes)} users")
+    points = table.repriced(point_table)
+    expected = table.totals(points)
+
+    stats = {'corrected': 0, 'created': 0, 'unchanged': 0, 'drift': 0}
+    repriced = int(np.count_nonzero(points != np.frombuffer(table.points, dtype=np.int64)))
+
+    def corrections():
+        if point_table:
+            yield from history_corrections(table, points)
+        yield from karma_corrections(expected, stored_totals(db, backup_path), stats)
+
+    if dry_run:
+        for _, path, data in corrections():
+            if path.startswith("userKarma/"):
+                print(f"  {path}: {data['totalKarma']}")
+    else:
+        written, failed = write_in_batches(db, corrections(), workers, label="Corrected")
+        if failed:
+            print(f"✗ Failed to write {failed} corrections")
+
+    if point_table:
+        print(f"✓ {repriced} history entries re-priced")
+    print(f"✓ {stats['corrected']} totals corrected (total drift {stats['drift']}), "
+          f"{stats['created']} created, {stats['unchanged']} unchanged")
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recompute user karma totals from karmaHistory.")
+    parser.add_argument("--points", metavar="POINTS_FILE",
+                        help="JSON point table to re-price history entries with, e.g. an updated KARMA_POINTS")
+    parser.add_argument("--backup", metavar="BACKUP_PATH",
+                        help="read history and totals from a backup directory, shard file or manifest")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="list the corrections without writing them")
+    parser.add_argument("--emulator", metavar="HOST:PORT",
+                        help="use the local Firestore emulator instead of the live project")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    if args.emulator:
+        os.environ["FIRESTORE_EMULATOR_HOST"] = args.emulator
+    recompute_karma(args.points, args.backup, args.workers, args.dry_run)
@@ -0,0 +1,105 @@
+import argparse
+import os
+import re
+from datetime import datetime
+
+import firestore_ops
+from back_up_firestore import CHANGE_FIELDS, iter_backup_records, extract_document
+from firestore_batches import DEFAULT_WORKERS, DEFAULT_WRITES_PER_SECOND, WriteThrottle, write_in_batches
+from setup_firebase import generate_doc_id
+
+ISO_TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,6})?(Z|[+-]\d{2}:\d{2})?$")
+# Fields holding timestamps, for backups written before records listed their timestamps
+LEGACY_TIMESTAMP_FIELDS = frozenset(CHANGE_FIELDS.values()) | {"createdAt", "readAt", "viewedAt", "moderatedAt",
+                                                               "deletedAt"}
+
+def legacy_timestamp_paths(value, path=()):
+    """Yield the key paths of ISO strings under LEGACY_TIMESTAMP_FIELDS keys, at any depth."""
+    items = value.items() if isinstance(value, dict) else enumerate(value)
+    for key, item in items:
+        if isinstance(item, str) and key in LEGACY_TIMESTAMP_FIELDS and ISO_TIMESTAMP.match(item):
+            yield [*path, key]
+        elif isinstance(item, (dict, list)):
+            yield from legacy_timestamp_paths(item, (*path, key))
+
+def restore_timestamps(data, paths=None):
+    """Convert the ISO strings written by convert_timestamp at the given key paths back into datetimes.
+
+    Without recorded paths only known timestamp fields are converted, so strings
+    that merely look like dates, e.g. a payload's builtAt, stay strings.
+    """
+    if paths is None:
+        paths = list(legacy_timestamp_paths(data))
+    for path in paths:
+        container = data
+        for key in path[:-1]:
+            container = container[key]
+        container[path[-1]] = datetime.fromisoformat(container[path[-1]].replace('Z', '+00:00'))
+    return data
+
+def normalize_record(record):
+    """Return (path, data, timestamp paths) for a backup record, including legacy episode-only backups.
+
+    The timestamp paths are None for backups that did not record them.
+    """
+    if 'path' in record and 'data' in record:
+        return record['path'], record['data'], record.get('timestamps')
+    # Old backups hold bare episode dicts without their IDs
+    return f"episodes/{generate_doc_id(record['title'])}", record, None
+
+def restore_operations(records, collections=None):
+    """Turn backup records into set operations, optionally limited to some collections."""
+    for record in records:
+        path, data, timestamps = normalize_record(record)
+        if collections and path.split("/")[0] not in collections:
+            continue
+        yield ("set", path, restore_timestamps(data, timestamps))
+
+def restore_firestore(backup_path, collections=None, only=None, workers=DEFAULT_WORKERS,
+                      writes_per_second=DEFAULT_WRITES_PER_SECOND):
+    """Restores a backup written by back_up_firestore.py using batched, parallel writes."""
+    db = firestore_ops.client()
+
+    print(f"Restoring from {backup_path}...")
+
+    if only:
+        # Restore individual documents, using the chunk index when the backup has one
+        records = []
+        for path in only:
+            record = extract_document(backup_path, path) if os.path.isdir(backup_path) else None
+            if record is None:
+                record = next((r for r in iter_backup_records(backup_path) if normalize_record(r)[0] == path), None)
+            if record is None:
+                print(f"✗ {path} not found in backup")
+            else:
+                records.append(record)
+    else:
+        records = iter_backup_records(backup_path)
+
+    throttle = WriteThrottle(writes_per_second) if writes_per_second else None
+    written, failed = write_in_batches(db, restore_operations(records, collections), workers, throttle, "Restored")
+
+    print(f"Restore completed! {written} documents written, {failed} failed")
+    return written, failed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Restore a backup written by back_up_firestore.py.")
+    parser.add_argument("backup", help="backup directory, shard file, legacy backup file or backup manifest")
+    parser.add_argument("--collections", nargs="+", help="only restore these top-level collections")
+    parser.add_argument("--only", nargs="+", metavar="DOC_PATH",
+                        help="only restore these documents, e.g. episodes/<id>")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently")
+    parser.add_argument("--writes-per-second", type=int, default=DEFAULT_WRITES_PER_SECOND,
+                        help="starting write rate, ramped up 50%% every 5 minutes (0 disables throttling)")
+    parser.add_argument("--emulator", metavar="HOST:PORT",
+                        help="restore into the local Firestore emulator instead of the live project")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    if args.emulator:
+        os.environ["FIRESTORE_EMULATOR_HOST"] = args.emulator
+    restore_firestore(args.backup, args.collections, args.only, args.workers, args.writes_per_second)
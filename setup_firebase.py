@@ -1,20 +1,95 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
+import argparse
+import hashlib
 import json
+import os
 import re
-from datetime import datetime
 
-def initialize_firebase():
-    """Initialize Firebase Admin SDK if not already initialized."""
-    try:
-        firebase_admin.get_app()
-    except ValueError:
-        cred = credentials.Certificate("serviceAccountKey.json")
-        firebase_admin.initialize_app(cred)
-    return firestore.client()
+import firestore_ops
+from back_up_firestore import iter_shard_records
+from firestore_batches import DEFAULT_WORKERS, write_in_batches
+
+DEFAULT_HASH_MANIFEST = "episode_hashes.json"
+# Number of episodes whose stored hashes are fetched per get_all call
+LOOKUP_WINDOW = 300
+# Transcript entries per episodes/{id}/transcriptChunks document
+TRANSCRIPT_CHUNK_SIZE = 200
+
+def generate_doc_id(title):
+    """Generate the sanitized document ID used for an episode title."""
+    return re.sub(r"[^a-zA-Z0-9_-]", "", title.replace(" ", "_").lower())
+
+def field_hashes(item):
+    """Hash every top-level field of an incoming episode, so changes can be diffed per field."""
+    return {
+        key: hashlib.sha256(
+            json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        for key, value in item.items()
+    }
+
+def load_hash_manifest(path):
+    """Load the local cache of per-field hashes, keyed by episode ID."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_hash_manifest(path, hashes):
+    """Atomically replace the local hash cache."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def time_to_seconds(time_string):
+    """Convert a transcript time like "(01:02:03)" to seconds."""
+    seconds = 0
+    for part in time_string.strip("() ").split(":"):
+        if part.isdigit():
+            seconds = seconds * 60 + int(part)
+    return seconds
+
+def split_transcript(transcript, chunk_size=TRANSCRIPT_CHUNK_SIZE):
+    """Split a transcript into fixed-size segment documents and the small index kept on the episode."""
+    firestore = firestore_ops.sdk()
+    chunks = []
+    index = []
+    for number, start in enumerate(range(0, len(transcript), chunk_size)):
+        entries = transcript[start:start + chunk_size]
+        bounds = {
+            'startTime': entries[0].get('time', ''),
+            'endTime': entries[-1].get('time', ''),
+            'startSeconds': time_to_seconds(entries[0].get('time', '')),
+            'endSeconds': time_to_seconds(entries[-1].get('time', '')),
+        }
+        chunk_id = f"{number:04d}"
+        chunks.append((chunk_id, {'index': number, **bounds, 'entries': entries,
+                                 'updatedAt': firestore.SERVER_TIMESTAMP}))
+        index.append({'id': chunk_id, **bounds, 'count': len(entries)})
+    return chunks, index
+
+def existing_chunk_ids(db, doc_id):
+    """List an episode's transcript chunk IDs with a key-only query."""
+    chunks = db.collection('episodes').document(doc_id).collection('transcriptChunks')
+    return [snapshot.id for snapshot in firestore_ops.stream(chunks.select([]), "keys")]
+
+def transcript_operations(doc_id, transcript, existing_ids=()):
+    """Build the chunk writes for an episode's transcript and the index fields for the episode.
+
+    Chunks left over from a longer previous transcript are deleted.
+    """
+    chunks, index = split_transcript(transcript)
+    prefix = f"episodes/{doc_id}/transcriptChunks"
+    operations = [("set", f"{prefix}/{chunk_id}", data) for chunk_id, data in chunks]
+    current = {chunk_id for chunk_id, _ in chunks}
+    operations += [("delete", f"{prefix}/{chunk_id}", None) for chunk_id in existing_ids if chunk_id not in current]
+    return operations, {'transcriptChunks': index, 'transcriptChunkCount': len(index)}
 
 def create_collections(db):
-    """Create necessary collections with example documents."""
+    """Create necessary collections with example documents, leaving an existing admin user untouched."""
+    from google.api_core.exceptions import AlreadyExists
+
+    firestore = firestore_ops.sdk()
     # Example admin user
     admin_data = {
         'email': 'admin@example.com',  # Replace with real admin email
@@ -25,14 +100,17 @@ def create_collections(db):
             'showControversialFlags': True,
             'showUnvalidatedFlags': True
         },
-        'createdAt': datetime.now(),
-        'updatedAt': datetime.now()
+        'createdAt': firestore.SERVER_TIMESTAMP,
+        'updatedAt': firestore.SERVER_TIMESTAMP
     }
     
     try:
         # Create users collection with admin user
-        db.collection('users').document('admin').set(admin_data)
-        print("✓ Created admin user")
+        try:
+            firestore_ops.create_document(db.collection('users').document('admin'), admin_data)
+            print("✓ Created admin user")
+        except AlreadyExists:
+            print("✓ Admin user already exists")
         
         # Create fact checks collection (empty for now)
         # We'll let users create fact checks through the app
@@ -41,52 +119,170 @@ def create_collections(db):
     except Exception as e:
         print(f"Error creating collections: {e}")
 
-def update_episodes_structure(db, json_file):
-    """Update existing episodes with new structure elements."""
-    with open(json_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def episode_operations(items, shard_transcripts=False):
+    """Turn raw episode items into set operations with the new structure elements.
 
-    for item in data:
+    With shard_transcripts=True the transcript is written as transcriptChunks
+    documents, committed in the same batch as the episode.
+    """
+    firestore = firestore_ops.sdk()
+    for item in items:
         # Generate a sanitized document ID
-        doc_id = re.sub(r"[^a-zA-Z0-9_-]", "", item["title"].replace(" ", "_").lower())
-        
+        doc_id = generate_doc_id(item["title"])
+
         # Add new fields to the episode structure
         enhanced_item = {
             **item,
-            'createdAt': datetime.now(),
-            'updatedAt': datetime.now(),
+            'createdAt': firestore.SERVER_TIMESTAMP,
+            'updatedAt': firestore.SERVER_TIMESTAMP,
             'factCheckCount': 0,  # Will be updated as fact checks are added
             'validatedFactCheckCount': 0,
             'controversialFactCheckCount': 0,
             'totalFactCheckScore': 0,  # Sum of all fact check votes
-            'topFactChecks': []  # Array of top 3 fact check IDs for quick access
+            'topFactChecks': [],  # Array of top 3 fact check IDs for quick access
+            'contentHashes': field_hashes(item)  # Lets later upserts skip unchanged fields
         }
+        if shard_transcripts and 'transcript' in enhanced_item:
+            chunk_operations, chunk_fields = transcript_operations(doc_id, enhanced_item.pop('transcript'))
+            enhanced_item.update(chunk_fields)
+            yield chunk_operations + [("set", f"episodes/{doc_id}", enhanced_item)]
+        else:
+            yield ("set", f"episodes/{doc_id}", enhanced_item)
 
-        try:
-            print(f"Uploading: {item['title']}...")
-            db.collection('episodes').document(doc_id).set(enhanced_item)
-            print(f"✓ Uploaded: {item['title']} with ID: {doc_id}")
-        except Exception as e:
-            print(f"✗ Failed to upload {item['title']}: {e}")
+def stored_hashes(db, doc_ids):
+    """Fetch only the contentHashes field of existing episodes.
+
+    Returns a dict with an entry for every episode that exists; episodes written
+    before hashes were stored map to an empty dict.
+    """
+    refs = [db.collection('episodes').document(doc_id) for doc_id in doc_ids]
+    return {
+        snapshot.id: (snapshot.to_dict() or {}).get('contentHashes') or {}
+        for snapshot in firestore_ops.get_all(db, refs, field_paths=['contentHashes'])
+        if snapshot.exists
+    }
+
+def upsert_operations(db, items, cache, stats, shard_transcripts=False):
+    """Yield writes only for new episodes and for the fields that changed in existing ones.
+
+    Stored hashes come from the local cache when it knows the episode and from
+    Firestore otherwise; episodes Firestore confirms unchanged are added to the
+    cache. Existing episodes are merged, so counters and createdAt are never touched.
+    """
+    window = {}
+    firestore = firestore_ops.sdk()
+
+    def flush():
+        remote_ids = [doc_id for doc_id in window if doc_id not in cache]
+        known = {doc_id: cache[doc_id] for doc_id in window if doc_id in cache}
+        if remote_ids:
+            known.update(stored_hashes(db, remote_ids))
+        for doc_id, item in window.items():
+            hashes = field_hashes(item)
+            if doc_id not in known:
+                stats['created'] += 1
+                yield from episode_operations([item], shard_transcripts)
+                continue
+            previous = known[doc_id]
+            changes = {key: item[key] for key, digest in hashes.items() if previous.get(key) != digest}
+            # Fields dropped from the feed are removed from the document too
+            changes.update({key: firestore.DELETE_FIELD for key in previous if key not in hashes})
+            if not changes:
+                stats['unchanged'] += 1
+                cache[doc_id] = hashes
+                continue
+            stats['updated'] += 1
+            chunk_operations = []
+            if shard_transcripts and 'transcript' in changes:
+                transcript = item.get('transcript', [])
+                chunk_operations, chunk_fields = transcript_operations(doc_id, transcript, existing_chunk_ids(db, doc_id))
+                changes['transcript'] = firestore.DELETE_FIELD
+                changes.update(chunk_fields)
+            yield chunk_operations + [("merge", f"episodes/{doc_id}", {
+                **changes,
+                'contentHashes': hashes,
+                'updatedAt': firestore.SERVER_TIMESTAMP
+            })]
+        window.clear()
 
-def setup_firebase():
+    for item in items:
+        window[generate_doc_id(item["title"])] = item
+        if len(window) >= LOOKUP_WINDOW:
+            yield from flush()
+    yield from flush()
+
+def update_episodes_structure(db, json_file, workers=DEFAULT_WORKERS, upsert=False,
+                              hash_manifest=DEFAULT_HASH_MANIFEST, use_cache=True, shard_transcripts=False):
+    """Update existing episodes with new structure elements.
+
+    Episodes are parsed incrementally from a JSON array or JSON Lines file and
+    uploaded as batches, several in flight at once. With upsert=True only new
+    episodes and changed fields are written, and live counters are left alone.
+    """
+    episodes = iter_shard_records(json_file)
+    if not upsert:
+        written, failed = write_in_batches(db, episode_operations(episodes, shard_transcripts), workers,
+                                           label="Uploaded")
+        if failed:
+            print(f"✗ Failed to upload {failed} episodes")
+        return written
+
+    cache = load_hash_manifest(hash_manifest) if use_cache else {}
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0}
+
+    def remember(operations):
+        # Only committed writes reach the cache, so a failed batch is retried next run
+        for _, path, data in operations:
+            if path.count("/") == 1:
+                cache[path.split("/")[-1]] = data['contentHashes']
+
+    operations = upsert_operations(db, episodes, cache, stats, shard_transcripts)
+    written, failed = write_in_batches(db, operations, workers, label="Upserted", on_commit=remember)
+    save_hash_manifest(hash_manifest, cache)
+    print(f"✓ {stats['created']} created, {stats['updated']} updated, {stats['unchanged']} unchanged")
+    if failed:
+        print(f"✗ Failed to upsert {failed} episodes")
+    return written
+
+def setup_firebase(json_file="podcast_data.json", workers=DEFAULT_WORKERS, upsert=False,
+                   hash_manifest=DEFAULT_HASH_MANIFEST, use_cache=True, shard_transcripts=False):
     """Main function to set up Firebase with new structure."""
     print("Starting Firebase setup...")
     
     # Initialize Firebase
-    db = initialize_firebase()
+    db = firestore_ops.client()
     print("✓ Firebase initialized")
     
-    # Create new collections
-    create_collections(db)
-    print("✓ Collections created")
+    # Upserts only write changed episodes, so the example documents are left alone
+    if not upsert:
+        create_collections(db)
+        print("✓ Collections created")
     
     # Update episodes
-    json_file = "podcast_data.json"
-    update_episodes_structure(db, json_file)
+    update_episodes_structure(db, json_file, workers, upsert, hash_manifest, use_cache, shard_transcripts)
     print("✓ Episodes updated")
     
     print("\nFirebase setup completed!")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Set up Firestore and ingest episodes.")
+    parser.add_argument("--input", default="podcast_data.json",
+                        help="episodes as a JSON array or JSON Lines file")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches uploaded concurrently")
+    parser.add_argument("--upsert", action="store_true",
+                        help="only write new episodes and changed fields, keeping counters and createdAt")
+    parser.add_argument("--hash-manifest", default=DEFAULT_HASH_MANIFEST,
+                        help="local cache of per-field content hashes used by --upsert")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="compare against the hashes stored in Firestore instead of the local cache")
+    parser.add_argument("--shard-transcripts", action="store_true",
+                        help="store transcripts as episodes/{id}/transcriptChunks segment documents")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    setup_firebase()
\ No newline at end of file
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    setup_firebase(args.input, args.workers, args.upsert, args.hash_manifest, not args.no_cache,
+                   args.shard_transcripts)
\ No newline at end of file
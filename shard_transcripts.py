@@ -0,0 +1,81 @@
+import argparse
+
+import firestore_ops
+from firestore_batches import DEFAULT_WORKERS, MAX_BATCH_OPS, write_in_batches
+from setup_firebase import transcript_operations
+
+def migration_operations(db, stats, deferred):
+    """Yield one atomic group per episode: its chunk documents plus the episode update.
+
+    Episodes without an inline transcript are already sharded and are skipped, so the
+    migration can be re-run safely after an interruption. An episode with too many
+    chunks for one batch has its chunks yielded in separate groups and its final
+    group appended to deferred, to be committed once all of its chunks are written.
+    """
+    firestore = firestore_ops.sdk()
+    for doc in firestore_ops.stream(db.collection('episodes')):
+        data = doc.to_dict()
+        if 'transcript' not in data:
+            stats['skipped'] += 1
+            continue
+        chunk_operations, chunk_fields = transcript_operations(
+            doc.id, data['transcript'], [chunk['id'] for chunk in data.get('transcriptChunks', [])]
+        )
+        stats['migrated'] += 1
+        # Bumping updatedAt lets incremental backups, the search index and the payload
+        # materializer pick up the migrated episode
+        update = ("update", f"episodes/{doc.id}", {
+            **chunk_fields,
+            'transcript': firestore.DELETE_FIELD,
+            'updatedAt': firestore.SERVER_TIMESTAMP
+        })
+        if len(chunk_operations) < MAX_BATCH_OPS:
+            # The inline transcript is only removed in the same commit that writes its chunks
+            yield chunk_operations + [update]
+            continue
+        leading = chunk_operations[:-(MAX_BATCH_OPS - 1)]
+        # Registered before yielding, since a leading group may commit before the generator resumes
+        deferred.append(({path for _, path, _ in leading}, chunk_operations[len(leading):] + [update]))
+        for start in range(0, len(leading), MAX_BATCH_OPS):
+            yield leading[start:start + MAX_BATCH_OPS]
+
+def shard_transcripts(workers=DEFAULT_WORKERS):
+    """Moves inline episode transcripts into transcriptChunks subcollections."""
+    print("Starting transcript migration...")
+    db = firestore_ops.client()
+
+    stats = {'migrated': 0, 'skipped': 0}
+    deferred = []
+    committed = set()
+
+    def record(operations):
+        # Only chunks of episodes split across batches need tracking
+        if deferred:
+            committed.update(path for _, path, _ in operations)
+
+    written, failed = write_in_batches(db, migration_operations(db, stats, deferred), workers, label="Wrote",
+                                       on_commit=record)
+    # Episodes split across batches only drop their inline transcript once every leading chunk is written
+    ready = [group for leading, group in deferred if leading <= committed]
+    if ready:
+        more_written, more_failed = write_in_batches(db, ready, workers, label="Finished")
+        written += more_written
+        failed += more_failed
+    failed += sum(len(group) for leading, group in deferred if not leading <= committed)
+
+    print(f"✓ {stats['migrated']} episodes sharded, {stats['skipped']} already sharded")
+    if failed:
+        print(f"✗ {failed} writes failed; re-run to retry the affected episodes")
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Move inline episode transcripts into transcriptChunks documents.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of batches committed concurrently")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    shard_transcripts(args.workers)
@@ -0,0 +1,100 @@
+import json
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_DIR = ".prompt_cache"
+DEFAULT_WORKERS = 8
+
+def read_text(path):
+    """Read a source file through a memory map, replacing undecodable bytes."""
+    with open(path, "rb") as f:
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return str(mapped, "utf-8", errors="replace")
+
+class SourceCache:
+    """Caches file contents on disk, keyed by path, modification time and size.
+
+    Only files whose mtime or size changed since the last run are read again, and
+    those reads run concurrently. Entries are [mtime_ns, size, content, derived].
+    """
+
+    def __init__(self, cache_file=os.path.join(DEFAULT_CACHE_DIR, "sources.json")):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.dirty = False
+        self.reads = 0
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # A corrupt cache is just rebuilt
+                self.entries = {}
+
+    def read_many(self, paths, workers=DEFAULT_WORKERS):
+        """Return {path: content}, re-reading only files that changed."""
+        stale = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                self.entries[path] = [None, None, f"[Error reading file: {e}]"]
+                continue
+            key = [stat.st_mtime_ns, stat.st_size]
+            entry = self.entries.get(path)
+            if entry is None or entry[:2] != key:
+                stale[path] = key
+
+        def load(path):
+            try:
+                return path, read_text(path), None
+            except OSError as e:
+                return path, None, e
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, content, error in executor.map(load, stale):
+                self.reads += 1
+                if error is None:
+                    self.entries[path] = stale[path] + [content]
+                    self.dirty = True
+                else:
+                    # Failures are reported in place of the content and never cached
+                    self.entries[path] = [None, None, f"[Error reading file: {error}]"]
+        return {path: self.entries[path][2] for path in paths}
+
+    def read(self, path):
+        return self.read_many([path])[path]
+
+    def derive(self, path, name, compute):
+        """Return compute(content) for a file read through this cache, memoized alongside its content.
+
+        Derived values, e.g. token counts, are invalidated together with the content.
+        """
+        entry = self.entries[path]
+        if entry[0] is None:
+            return compute(entry[2])
+        if len(entry) < 4:
+            entry.append({})
+        if name not in entry[3]:
+            entry[3][name] = compute(entry[2])
+            self.dirty = True
+        return entry[3][name]
+
+    def save(self):
+        """Atomically write the cache back, dropping files that no longer exist."""
+        stale = [path for path in self.entries if not os.path.exists(path)]
+        for path in stale:
+            del self.entries[path]
+        if not (self.dirty or stale):
+            return
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({path: entry for path, entry in self.entries.items() if entry[0] is not None}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.cache_file)
+        self.dirty = False
@@ -4,8 +4,151 @@ import { useEffect, useState } from 'react';
 import { useSearchParams } from 'next/navigation';
 import { collection, query, getDocs } from 'firebase/firestore';
 import { db } from '../../lib/firebase/firebaseConfig';
+import { secondsToTimeString } from '../../lib/utils/time';
 import Link from 'next/link';
 
+// Static index published by build_search_index.py
+const SEARCH_INDEX_URL = '/search-index';
+// Position used in the index for title and guest matches
+const METADATA_POSITION = -1;
+const MAX_RESULT_TIMES = 5;
+
+const tokenize = (text) => text.toLowerCase().match(/[a-z0-9]+/g) || [];
+
+// Decode [docDelta, count, position, positionDelta...] groups into a Map of doc -> positions
+function decodePostings(postings) {
+  const docs = new Map();
+  let doc = 0;
+  let i = 0;
+  while (i < postings.length) {
+    doc = i === 0 ? postings[i] : doc + postings[i];
+    const count = postings[i + 1];
+    const positions = [];
+    let position = 0;
+    for (let k = 0; k < count; k++) {
+      position = k === 0 ? postings[i + 2] : position + postings[i + 2 + k];
+      positions.push(position);
+    }
+    docs.set(doc, positions);
+    i += 2 + count;
+  }
+  return docs;
+}
+
+// A term lives in the shard with the longest prefix it starts with; a prefix
+// search also needs every longer shard under the term
+function shardsForTerm(term, shards, isPrefix) {
+  const owner = shards
+    .filter(prefix => term.startsWith(prefix))
+    .sort((a, b) => b.length - a.length)[0];
+  const result = owner ? [owner] : [];
+  if (isPrefix) {
+    result.push(...shards.filter(prefix => prefix.startsWith(term) && prefix !== owner));
+  }
+  return result;
+}
+
+async function searchWithIndex(searchQuery) {
+  const response = await fetch(`${SEARCH_INDEX_URL}/index.json`);
+  if (!response.ok) return null;
+  const index = await response.json();
+
+  const stopWords = new Set(index.stopWords || []);
+  const allTerms = tokenize(searchQuery);
+  const terms = allTerms.some(term => !stopWords.has(term))
+    ? allTerms.filter(term => !stopWords.has(term))
+    : allTerms;
+  if (terms.length === 0) return [];
+
+  const shardCache = new Map();
+  const loadShard = (segmentId, prefix) => {
+    const url = `${SEARCH_INDEX_URL}/segments/${segmentId}/${prefix}.json`;
+    if (!shardCache.has(url)) {
+      shardCache.set(url, fetch(url).then(res => res.json()));
+    }
+    return shardCache.get(url);
+  };
+
+  // Documents are numbered per segment, so matches are keyed by "segment/doc"
+  const entries = new Map();
+  // key -> positions where every term so far occurs
+  let matches = null;
+  for (const [i, term] of terms.entries()) {
+    // The last term is still being typed, so it also matches as a prefix
+    const isPrefix = i === terms.length - 1;
+    // Every segment holds postings for different documents, so all of them are searched
+    const shards = await Promise.all(
+      index.segments.flatMap(segment =>
+        shardsForTerm(term, Object.keys(segment.shards), isPrefix)
+          .map(prefix => loadShard(segment.id, prefix).then(shard => [segment, shard]))
+      )
+    );
+
+    const termMatches = new Map();
+    for (const [segment, shard] of shards) {
+      for (const [candidate, postings] of Object.entries(shard)) {
+        if (candidate !== term && !(isPrefix && candidate.startsWith(term))) continue;
+        for (const [doc, positions] of decodePostings(postings)) {
+          // Superseded and deleted episodes are tombstoned as null until a merge purges them
+          const entry = segment.docs[doc];
+          if (!entry) continue;
+          const key = `${segment.id}/${doc}`;
+          entries.set(key, entry);
+          const merged = termMatches.get(key) || new Set();
+          positions.forEach(position => merged.add(position));
+          termMatches.set(key, merged);
+        }
+      }
+    }
+
+    if (matches === null) {
+      matches = termMatches;
+    } else {
+      const intersection = new Map();
+      for (const [key, positions] of matches) {
+        if (!termMatches.has(key)) continue;
+        const shared = new Set([...positions].filter(position => termMatches.get(key).has(position)));
+        // Prefer positions where the terms occur together, else keep the earlier ones
+        intersection.set(key, shared.size > 0 ? shared : positions);
+      }
+      matches = intersection;
+    }
+    if (matches.size === 0) break;
+  }
+
+  return [...matches]
+    .map(([key, positions]) => {
+      const [id, title, guest, date] = entries.get(key);
+      const times = [...positions].filter(position => position !== METADATA_POSITION).sort((a, b) => a - b);
+      return {
+        id,
+        title,
+        guest,
+        date,
+        inMetadata: positions.has(METADATA_POSITION),
+        matchCount: times.length,
+        times: times.slice(0, MAX_RESULT_TIMES),
+      };
+    })
+    .sort((a, b) => (b.inMetadata - a.inMetadata) || (b.matchCount - a.matchCount));
+}
+
+async function searchByScan(searchQuery) {
+  // Fetch all episodes and filter client-side for case-insensitive search
+  const episodesRef = collection(db, 'episodes');
+  const querySnapshot = await getDocs(episodesRef);
+
+  return querySnapshot.docs
+    .map(doc => ({
+      id: doc.id,
+      ...doc.data()
+    }))
+    .filter(episode =>
+      episode.title?.toLowerCase().includes(searchQuery) ||
+      episode.guest?.toLowerCase().includes(searchQuery)
+    );
+}
+
 export default function SearchResults() {
   const searchParams = useSearchParams();
   const searchQuery = searchParams.get('q')?.toLowerCase();
@@ -22,19 +165,16 @@ export default function SearchResults() {
 
       try {
         setLoading(true);
-        // Fetch all episodes and filter client-side for case-insensitive search
-        const episodesRef = collection(db, 'episodes');
-        const querySnapshot = await getDocs(episodesRef);
-        
-        const searchResults = querySnapshot.docs
-          .map(doc => ({
-            id: doc.id,
-            ...doc.data()
-          }))
-          .filter(episode => 
-            episode.title?.toLowerCase().includes(searchQuery) ||
-            episode.guest?.toLowerCase().includes(searchQuery)
-          );
+        let searchResults = null;
+        try {
+          searchResults = await searchWithIndex(searchQuery);
+        } catch (error) {
+          console.error('Search index unavailable, scanning episodes instead:', error);
+        }
+        // Without a published index, fall back to filtering every episode
+        if (searchResults === null) {
+          searchResults = await searchByScan(searchQuery);
+        }
 
         setResults(searchResults);
       } catch (error) {
@@ -66,19 +206,37 @@ export default function SearchResults() {
       ) : (
         <div className="grid gap-6">
           {results.map((episode) => (
-            <Link
-              href={`/episode/${episode.id}`}
+            <div
               key={episode.id}
-              className="block p-6 bg-white rounded-lg shadow hover:shadow-md transition-shadow"
+              className="p-6 bg-white rounded-lg shadow hover:shadow-md transition-shadow"
             >
-              <h2 className="text-xl font-semibold mb-2">{episode.title}</h2>
-              <p className="text-gray-600">
-                Guest: {episode.guest}
-              </p>
-              <p className="text-gray-500 text-sm">
-                Date: {new Date(episode.date).toLocaleDateString()}
-              </p>
-            </Link>
+              <Link href={`/episode/${episode.id}`} className="block">
+                <h2 className="text-xl font-semibold mb-2">{episode.title}</h2>
+                <p className="text-gray-600">
+                  Guest: {episode.guest}
+                </p>
+                <p className="text-gray-500 text-sm">
+                  Date: {new Date(episode.date).toLocaleDateString()}
+                </p>
+              </Link>
+              {episode.times?.length > 0 && (
+                <p className="text-sm mt-2">
+                  <span className="text-gray-600">Mentioned at </span>
+                  {episode.times.map((seconds) => {
+                    const time = secondsToTimeString(seconds);
+                    return (
+                      <Link
+                        key={seconds}
+                        href={`/episode/${episode.id}#transcript-${time.replace(/:/g, '')}`}
+                        className="text-blue-600 hover:underline mr-2"
+                      >
+                        {time}
+                      </Link>
+                    );
+                  })}
+                </p>
+              )}
+            </div>
           ))}
         </div>
       )}
@@ -3,6 +3,18 @@ import { adminDb } from '../firebase/firebaseAdmin';
 import { serializeFirebaseData } from '../utils/time';
 import { factCheckService } from './factCheckService';
 
+// Must match PAYLOAD_VERSION in materialize_episodes.py
+const PAYLOAD_VERSION = 1;
+
+interface TranscriptChunkInfo {
+  id: string;
+  startTime: string;
+  endTime: string;
+  startSeconds: number;
+  endSeconds: number;
+  count: number;
+}
+
 interface EpisodeData {
   id: string;
   thumbnail: string;
@@ -36,8 +48,75 @@ export const episodeService = {
     }
   },
 
+  // Episodes ingested with sharded transcripts keep only a chunk index on the
+  // document; the entries live in episodes/{id}/transcriptChunks.
+  async getTranscript(id: string, episodeData: any, fromSeconds?: number, toSeconds?: number): Promise<any[]> {
+    if (episodeData?.transcript) {
+      return episodeData.transcript;
+    }
+
+    const chunks: TranscriptChunkInfo[] = (episodeData?.transcriptChunks || []).filter((chunk: TranscriptChunkInfo) =>
+      (fromSeconds === undefined || chunk.endSeconds >= fromSeconds) &&
+      (toSeconds === undefined || chunk.startSeconds <= toSeconds)
+    );
+    if (chunks.length === 0) {
+      return [];
+    }
+
+    const chunksRef = adminDb.collection('episodes').doc(id).collection('transcriptChunks');
+    const snapshots = await adminDb.getAll(...chunks.map(chunk => chunksRef.doc(chunk.id)));
+    return snapshots.flatMap(snapshot => snapshot.data()?.entries || []);
+  },
+
+  async getTranscriptRange(id: string, fromSeconds: number, toSeconds: number): Promise<any[]> {
+    try {
+      // Read only the chunk index, then only the chunks overlapping the range
+      const [docSnap] = await adminDb.getAll(
+        adminDb.collection('episodes').doc(id),
+        { fieldMask: ['transcriptChunks'] }
+      );
+      if (!docSnap.exists) {
+        return [];
+      }
+      return await this.getTranscript(id, docSnap.data(), fromSeconds, toSeconds);
+    } catch (error) {
+      console.error('Error fetching transcript range:', error);
+      throw error;
+    }
+  },
+
+  // Payloads precomputed by materialize_episodes.py: one read instead of the
+  // episode, its fact checks and the reshaping below. Fact checks stay live on the
+  // page through useFactChecks, so a payload from the last run is fine to serve.
+  async getMaterializedEpisode(id: string): Promise<EpisodeData | null> {
+    const payloadRef = adminDb.collection('episodePayloads').doc(id);
+    const payloadSnap = await payloadRef.get();
+    const payload = payloadSnap.data();
+    if (!payload || payload.version !== PAYLOAD_VERSION) {
+      return null;
+    }
+
+    let data = payload.data;
+    if (payload.parts > 1) {
+      const partsRef = payloadRef.collection('parts');
+      const parts = await adminDb.getAll(
+        ...Array.from({ length: payload.parts - 1 }, (_, i) => partsRef.doc(String(i + 1)))
+      );
+      data += parts.map(part => part.data()?.data || '').join('');
+    }
+    return JSON.parse(data).episode as EpisodeData;
+  },
+
   async getEpisodeById(id: string): Promise<EpisodeData | null> {
     try {
+      const materialized = await this.getMaterializedEpisode(id).catch(error => {
+        console.error('Error reading materialized episode, building it instead:', error);
+        return null;
+      });
+      if (materialized) {
+        return materialized;
+      }
+
       const docRef = adminDb.collection('episodes').doc(id);
       const docSnap = await docRef.get();
       
@@ -57,7 +136,7 @@ export const episodeService = {
         date: episodeData?.date || '',
         video_link: episodeData?.video_link || '',
         timestamps: episodeData?.timestamps || [],
-        transcript: episodeData?.transcript || [],
+        transcript: await this.getTranscript(id, episodeData),
         factChecks: organizedFactChecks
       }) as EpisodeData;
     } catch (error) {
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
 # scripts/generate_test_prompt.py
 
+import argparse
 import os
-import re
+import subprocess
 import sys
 import yaml
 from pathlib import Path
-import pyperclip
+
+from bundler import DEFAULT_TOKEN_BUDGET, build_bundle, estimate_tokens, rank_by_distance
+from import_graph import ImportGraph, normalize_path
+from source_cache import SourceCache
 
 # Optional: If you want to copy output to clipboard automatically, uncomment these lines:
 # try:
@@ -32,129 +36,50 @@ TEST_ROOT = config.get("testRoot", "test")
 INCLUDE_EXTENSIONS = config.get("includeExtensions", [".js", ".ts", ".jsx", ".tsx"])
 
 ##############################################################################
-# 2) Regex to find import statements
+# 2) Import graph: cached on disk, only changed files are re-parsed
 ##############################################################################
 
-# This pattern tries to capture file-based imports, e.g.:
-# import X from '../someFile'
-# import { Y } from '@/components/XYZ'
-# require('somePath');
-# It's naïve and may need refinement for more complex patterns.
-IMPORT_PATTERN = re.compile(
-    r"(?:import\s+(?:[\w*\s{},]+)\s+from\s+['\"]([^'\"]+)['\"]|require\(['\"]([^'\"]+)['\"]\))"
-)
+def load_graph():
+    """Load the persistent import graph over the source and test trees, once per run."""
+    return ImportGraph(SOURCE_ROOT, INCLUDE_EXTENSIONS, extra_roots=[TEST_ROOT] if Path(TEST_ROOT).is_dir() else [])
 
-def is_local_file_import(path_str: str) -> bool:
+def gather_related_files(start_file: Path, max_depth=None, graph=None):
     """
-    Check if the import path is a relative or project-based local file path,
-    e.g. './', '../', or '@/'
-    as opposed to a library import like 'react', 'lodash', etc.
+    Gather all files that are imported (directly or indirectly) by 'start_file',
+    using the persistent import graph, nearest imports first.
     """
-    if path_str.startswith("./") or path_str.startswith("../"):
-        return True
-    if path_str.startswith("@/"):
-        return True
-    return False
+    graph = graph or load_graph().refresh()
+    return [Path(path) for path in rank_by_distance(graph, [start_file], max_depth)]
+
+def changed_files(revision="HEAD"):
+    """List source files changed relative to a git revision, plus untracked ones."""
+    commands = [
+        ["git", "diff", "--name-only", revision, "--"],
+        ["git", "ls-files", "--others", "--exclude-standard"],
+    ]
+    changed = []
+    for command in commands:
+        output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+        changed.extend(line for line in output.splitlines() if line not in changed)
+    return [path for path in changed if path.endswith(tuple(INCLUDE_EXTENSIONS)) and Path(path).exists()]
+
+def bundle_name(target: str) -> str:
+    """File name for a target's bundle, e.g. src/lib/a.ts -> src__lib__a.ts.md"""
+    return target.replace("/", "__") + ".md"
 
 
 ##############################################################################
-# 3) Utility: Resolve import path to an actual file
+# 3) Build final prompt: load prompt template, embed code
 ##############################################################################
 
-def resolve_import_path(base_file: Path, import_str: str) -> Path:
-    """
-    Attempt to resolve the import string (e.g. '../utils/whatever') to a real
-    file path on disk. We handle extension fallback like .js or .ts if not specified.
-    We also handle '@/...' which maps to SOURCE_ROOT in Next.js style.
-    """
-    # If import_str starts with '@/', treat everything after that as relative to SOURCE_ROOT
-    if import_str.startswith("@/"):
-        relative_path = import_str.replace("@/", "")
-        resolved_path = Path(SOURCE_ROOT, relative_path)
-    else:
-        # Otherwise, treat it as relative to the current file's directory
-        resolved_path = (base_file.parent / import_str).resolve()
-
-    # If the path already has a recognized extension, just return as-is
-    if resolved_path.suffix in INCLUDE_EXTENSIONS and resolved_path.exists():
-        return resolved_path
-
-    # If no extension was provided, or the file doesn't exist yet, try appending typical extensions
-    if resolved_path.is_dir():
-        # if it's a directory, maybe there's an index file
-        for ext in INCLUDE_EXTENSIONS:
-            index_candidate = resolved_path / f"index{ext}"
-            if index_candidate.exists():
-                return index_candidate
-    else:
-        # If it's a file but no extension, or missing extension
-        base_no_ext = str(resolved_path)
-        for ext in INCLUDE_EXTENSIONS:
-            candidate = Path(base_no_ext + ext)
-            if candidate.exists():
-                return candidate
-
-    return resolved_path  # fallback, might not exist
-
-
-##############################################################################
-# 4) Recursively gather all relevant files
-##############################################################################
-
-def gather_related_files(start_file: Path, visited=None):
-    """
-    Recursively gather all files that are imported (directly or indirectly)
-    by 'start_file'.
-    """
-    if visited is None:
-        visited = set()
-
-    # Normalize path
-    start_file = start_file.resolve()
-
-    # If start_file not valid or not in our source
-    if not start_file.exists() or not any(str(start_file).endswith(ext) for ext in INCLUDE_EXTENSIONS):
-        return []
-
-    if start_file in visited:
-        return []
-
-    visited.add(start_file)
-
-    # Read the file lines
-    try:
-        content = start_file.read_text(encoding="utf-8")
-    except Exception as e:
-        print(f"Error reading {start_file}: {e}")
-        return []
-
-    # Find imports
-    matches = IMPORT_PATTERN.findall(content)
-    # matches is a list of tuples [(import1, require1), (import2, require2), ...]
-    # Only one of those in each tuple will be non-empty
-    imported_paths = [m[0] if m[0] else m[1] for m in matches]
-
-    all_files = [start_file]
-    for imp in imported_paths:
-        # Skip external libraries
-        if not is_local_file_import(imp):
-            continue
-
-        resolved = resolve_import_path(start_file, imp)
-        related = gather_related_files(resolved, visited)
-        all_files.extend(related)
-
-    return all_files
-
-
-##############################################################################
-# 5) Build final prompt: load prompt template, embed code
-##############################################################################
-
-def build_prompt(file_list):
+def iter_prompt(file_list, cache=None, budget=DEFAULT_TOKEN_BUDGET):
     """
     1. Read prompt_template.md
-    2. For each file in file_list, append a heading plus the file content
+    2. For each file in file_list, yield a heading plus the file content
+
+    file_list is ranked nearest import first; once the token budget runs out, files
+    are reduced to their signatures and then left out. Batches pass one shared
+    SourceCache, so files common to several bundles are read once.
     """
     # Where is prompt_template.md? 
     # We assume it’s in the project root next to directory_map.yml
@@ -168,61 +93,114 @@ def build_prompt(file_list):
     with open(PROMPT_TEMPLATE_PATH, "r", encoding="utf-8") as tmpl:
         prompt_template = tmpl.read()
 
-    # Sort by filename to keep it tidy
-    sorted_files = sorted(file_list, key=lambda p: str(p))
+    # The template is always included, so it comes out of the budget first
+    if budget is not None:
+        budget = max(budget - estimate_tokens(prompt_template), 0)
+    shared = cache is not None
+    cache = cache or SourceCache()
+    bundle = build_bundle([str(p) for p in file_list], cache, budget)
+    if not shared:
+        cache.save()
 
     # Build the final prompt
-    final_prompt = [prompt_template]
-    final_prompt.append("\n\n")  # spacing
-    for file_path in sorted_files:
-        rel_path_str = str(file_path.relative_to(Path.cwd()))
-        # Read content
-        try:
-            code_content = file_path.read_text(encoding="utf-8")
-        except:
-            code_content = "ERROR: Could not read file content."
-
+    yield prompt_template
+    yield "\n\n"  # spacing
+    for rel_path_str, mode, code_content in bundle.sections:
         # Append code block
-        final_prompt.append(f"### File: {rel_path_str}\n")
-        final_prompt.append("```javascript\n")  # or just triple backticks if you want generic
-        final_prompt.append(code_content)
-        final_prompt.append("\n```\n\n")
+        heading = "Signatures" if mode == "summary" else "File"
+        yield f"### {heading}: {rel_path_str}\n"
+        yield "```javascript\n"  # or just triple backticks if you want generic
+        yield code_content
+        yield "\n```\n\n"
+    if bundle.omitted:
+        yield "### Omitted to fit the token budget\n"
+        yield "".join(f"- {path}\n" for path in bundle.omitted)
 
-    return "".join(final_prompt)
+def build_prompt(file_list, cache=None, budget=DEFAULT_TOKEN_BUDGET):
+    return "".join(iter_prompt(file_list, cache, budget))
 
 
 ##############################################################################
-# 6) Main entry point
+# 4) Main entry point
 ##############################################################################
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate test prompts from the import graph of source files.")
+    parser.add_argument("targets", nargs="*", help="source files, relative to the project root")
+    parser.add_argument("--diff", nargs="?", const="HEAD", metavar="REVISION",
+                        help="also target every source file changed since REVISION (default HEAD)")
+    parser.add_argument("--dependents", action="store_true",
+                        help="list the files that transitively import each target instead of bundling")
+    parser.add_argument("--depth", type=int, help="stop following imports this many levels away")
+    parser.add_argument("--output-dir", help="write one bundle per target into this directory")
+    parser.add_argument("--budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help=f"approximate token budget per bundle, 0 for no limit (default {DEFAULT_TOKEN_BUDGET})")
+    return parser.parse_args()
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python generate_test_prompt.py <relative_path_to_source_file>")
+    args = parse_args()
+    targets = [normalize_path(target) for target in args.targets]
+    if args.diff:
+        targets += [target for target in changed_files(args.diff) if target not in targets]
+    if not targets:
+        print("Usage: python test_prompt.py <relative_path_to_source_file>... [--diff [REVISION]]")
         sys.exit(1)
 
-    target_relative = sys.argv[1]
-
-    # Make sure we interpret the path relative to project root
-    target_file = Path.cwd() / target_relative
-
-    if not target_file.exists():
-        print(f"ERROR: The target file '{target_file}' does not exist.")
+    missing = [target for target in targets if not Path(target).exists()]
+    if missing:
+        print(f"ERROR: The target files {missing} do not exist.")
         sys.exit(1)
 
-    # Gather related files
-    all_files = gather_related_files(target_file)
-
-    # Build the prompt
-    prompt_text = build_prompt(all_files)
-
-    # Print to console
-    print("=== GENERATED TEST PROMPT ===")
-    print(prompt_text)
-
-    # Optionally copy to clipboard
-
-    pyperclip.copy(prompt_text)
-    print("[INFO] Prompt copied to clipboard!")
+    # The graph is refreshed once and answers every query of the batch
+    graph = load_graph().refresh()
+    graph.save()
+
+    if args.dependents:
+        affected = set()
+        for target in targets:
+            dependents = graph.dependents(target, args.depth)
+            affected.update(dependents)
+            print(f"{target} ({len(dependents)} dependents)")
+            for path in sorted(dependents):
+                print(f"  {path}")
+        if len(targets) > 1:
+            print(f"\nAll affected files ({len(affected)}):")
+            for path in sorted(affected):
+                print(f"  {path}")
+        return
+
+    budget = args.budget or None
+    bundles = {}
+    for target in targets:
+        all_files = gather_related_files(target, args.depth, graph)
+        if not all_files:
+            print(f"ERROR: '{target}' is not a {'/'.join(INCLUDE_EXTENSIONS)} source file.")
+            sys.exit(1)
+        bundles[target] = all_files
+
+    if len(targets) == 1 and not args.output_dir:
+        # Build the prompt
+        prompt_text = build_prompt(bundles[targets[0]], budget=budget)
+
+        # Print to console
+        print("=== GENERATED TEST PROMPT ===")
+        print(prompt_text)
+
+        # Optionally copy to clipboard
+        import pyperclip
+
+        pyperclip.copy(prompt_text)
+        print("[INFO] Prompt copied to clipboard!")
+        return
+
+    output_dir = Path(args.output_dir or "test_prompts")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cache = SourceCache()
+    for target, all_files in bundles.items():
+        with open(output_dir / bundle_name(target), "w", encoding="utf-8") as out:
+            out.writelines(iter_prompt(all_files, cache, budget))
+        print(f"[INFO] {target}: {len(all_files)} files -> {output_dir / bundle_name(target)}")
+    cache.save()
 
 if __name__ == "__main__":
     main()
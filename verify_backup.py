@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import firestore_ops
+from back_up_firestore import (
+    DEFAULT_WORKERS, MERKLE_SUFFIX, MerkleTree, discover_collections, document_hash, iter_chain_records,
+    iter_shard_records, list_shards, load_chain, merkle_bucket, mismatched_buckets, read_located_records, record_hash
+)
+
+# Paths listed per kind of difference and shard; the report file has all of them
+MAX_LISTED = 10
+
+class SnapshotShard:
+    """One shard of a backup, with its stored hash tree when the backup has one."""
+
+    def __init__(self, records, filename=None):
+        self.records = records
+        self.filename = filename
+        self.tree_file = f"{filename}{MERKLE_SUFFIX}" if filename else None
+        self.stored_tree = None
+
+    def tree(self):
+        if self.tree_file and os.path.exists(self.tree_file):
+            self.stored_tree = MerkleTree.load(self.tree_file)
+            return self.stored_tree
+        # Backups written before trees were stored are hashed on the fly
+        tree = MerkleTree()
+        for record in self.records():
+            tree.add_record(record)
+        return tree
+
+    def entries(self, depth, buckets):
+        """Yield (path, content hash) for the documents in the given leaf buckets.
+
+        With record locations in the stored tree only those documents are read;
+        otherwise the whole shard is streamed.
+        """
+        if self.stored_tree is not None and self.stored_tree.locations is not None:
+            records = read_located_records(self.filename, list(self.stored_tree.located(depth, buckets)))
+        else:
+            records = (record for record in self.records() if merkle_bucket(record['path'], depth) in buckets)
+        for record in records:
+            yield record['path'], record_hash(record)
+
+class LiveShard:
+    """One shard hashed from the live database, spooled to disk for drilling down later."""
+
+    def __init__(self, spool_file):
+        self.spool_file = spool_file
+        self.spool = open(spool_file, "w", encoding="utf-8")
+        self.live_tree = MerkleTree()
+
+    def add(self, path, content_hash):
+        self.live_tree.add(path, content_hash)
+        self.spool.write(f"{path}\t{content_hash}\n")
+
+    def tree(self):
+        return self.live_tree
+
+    def entries(self, depth, buckets):
+        with open(self.spool_file, "r", encoding="utf-8") as f:
+            for line in f:
+                path, content_hash = line.rstrip("\n").split("\t")
+                if merkle_bucket(path, depth) in buckets:
+                    yield path, content_hash
+
+def snapshot_shards(path):
+    """Map shard names to SnapshotShards for a backup directory or a backup manifest."""
+    if os.path.isdir(path):
+        shards = list_shards(path)
+    else:
+        chain = load_chain(path)
+        if len(chain) > 1:
+            # The stored trees cover single exports, so a chain is hashed from its current records
+            names = sorted({name for _, shards in chain for name in shards})
+            return {name: SnapshotShard(lambda name=name: iter_chain_records(chain, name)) for name in names}
+        shards = chain[0][1]
+    return {
+        name: SnapshotShard(lambda filename=filename: iter_shard_records(filename), filename)
+        for name, filename in shards.items()
+    }
+
+def shard_name(path):
+    """Return the shard a document path belongs to, e.g. factChecks/a/votes/b -> factChecks.votes"""
+    return ".".join(path.split("/")[0::2])
+
+def hash_live(db, names, spool_dir, workers=DEFAULT_WORKERS):
+    """Hash the live documents of the given shards in one parallel pass.
+
+    Top-level collections are streamed one per worker; each subcollection group is
+    streamed once and its documents routed to the shards of their parent collections.
+    """
+    shards = {name: LiveShard(os.path.join(spool_dir, f"{name}.tsv")) for name in names}
+    queries = [(db.collection(name), [name]) for name in names if "." not in name]
+    groups = {}
+    for name in names:
+        if "." in name:
+            groups.setdefault(name.split(".")[-1], []).append(name)
+    queries += [(db.collection_group(group), group_names) for group, group_names in groups.items()]
+
+    def hash_query(query, query_names):
+        count = 0
+        for doc in firestore_ops.stream(query):
+            name = shard_name(doc.reference.path)
+            if name in query_names:
+                shards[name].add(doc.reference.path, document_hash(doc.to_dict()))
+                count += 1
+        return count
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(hash_query, query, query_names) for query, query_names in queries]
+        for future in futures:
+            future.result()
+    for shard in shards.values():
+        shard.spool.close()
+    return shards
+
+def compare_shard(source, target):
+    """Diff two shards through their trees, reading documents only in mismatching leaves."""
+    source_tree, target_tree = source.tree(), target.tree()
+    depth, buckets = mismatched_buckets(source_tree, target_tree)
+    result = {"documents": source_tree.count, "targetDocuments": target_tree.count,
+              "leaves": 1 << (4 * depth), "mismatchedLeaves": len(buckets)}
+    if not buckets:
+        return result
+    wanted = set(buckets)
+    left = dict(source.entries(depth, wanted))
+    right = dict(target.entries(depth, wanted))
+    result["onlyInBackup"] = sorted(path for path in left if path not in right)
+    result["onlyInTarget"] = sorted(path for path in right if path not in left)
+    result["changed"] = sorted(path for path, digest in left.items() if path in right and right[path] != digest)
+    return result
+
+def print_shard(name, result, target_label):
+    if not result["mismatchedLeaves"]:
+        print(f"✓ {name}: {result['documents']} documents match")
+        return
+    print(f"✗ {name}: {len(result['onlyInBackup'])} only in backup, {len(result['onlyInTarget'])} only in "
+          f"{target_label}, {len(result['changed'])} changed "
+          f"({result['mismatchedLeaves']} of {result['leaves']} ranges differ)")
+    for key, label in (("onlyInBackup", "only in backup"), ("onlyInTarget", f"only in {target_label}"),
+                       ("changed", "changed")):
+        for path in result[key][:MAX_LISTED]:
+            print(f"    {label}: {path}")
+        if len(result[key]) > MAX_LISTED:
+            print(f"    ... {len(result[key]) - MAX_LISTED} more {label}")
+
+def verify_backup(backup_path, against=None, workers=DEFAULT_WORKERS, report_file=None):
+    """Verify a backup against the live database, or against another backup when against is given.
+
+    Returns True if every shard matches.
+    """
+    source = snapshot_shards(backup_path)
+    target_label = "other backup" if against else "live"
+    print(f"Verifying {backup_path} ({len(source)} shards) against {against or 'the live database'}...")
+
+    with tempfile.TemporaryDirectory(prefix="verify_backup_") as spool_dir:
+        extra_collections = []
+        if against:
+            target = snapshot_shards(against)
+        else:
+            db = firestore_ops.client()
+            target = hash_live(db, sorted(source), spool_dir, workers)
+            extra_collections = sorted(set(discover_collections(db)) - {name.split(".")[0] for name in source})
+
+        names = sorted(set(source) & set(target))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(zip(names, executor.map(lambda name: compare_shard(source[name], target[name]), names)))
+
+    ok = True
+    for name in names:
+        print_shard(name, results[name], target_label)
+        ok = ok and not results[name]["mismatchedLeaves"]
+    for name in sorted(set(source) - set(target)):
+        print(f"✗ {name}: only in the backup")
+        ok = False
+    for name in sorted(set(target) - set(source)) + extra_collections:
+        print(f"✗ {name}: not in the backup")
+        ok = False
+
+    if report_file:
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump({"backup": backup_path, "against": against or "live", "ok": ok, "shards": results,
+                       "notInBackup": sorted(set(target) - set(source)) + extra_collections,
+                       "onlyInBackup": sorted(set(source) - set(target))}, f, ensure_ascii=False, indent=2)
+    print("Backup verified, everything matches" if ok else "Backup differs")
+    return ok
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Verify a backup against the live database or another backup.")
+    parser.add_argument("backup", help="backup directory or backup manifest")
+    parser.add_argument("--against", metavar="BACKUP",
+                        help="compare with another backup directory or manifest instead of the live database")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of shards hashed and compared concurrently")
+    parser.add_argument("--report", metavar="FILE", help="write every difference to FILE as JSON")
+    firestore_ops.add_stats_argument(parser)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    firestore_ops.report_at_exit(args.stats)
+    sys.exit(0 if verify_backup(args.backup, args.against, args.workers, args.report) else 1)